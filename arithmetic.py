@@ -0,0 +1,83 @@
+from enum import Enum
+from math import gcd as pythonGcd
+
+try:
+    import gmpy2
+except ImportError:
+    # Only needed by `IntBackend.gmpy2`
+    gmpy2 = None
+
+
+class IntBackend(Enum):
+    # CPython `int`, always there
+    python = 1
+    # `gmpy2.mpz`, much faster multiply and `pow` for big numbers
+    gmpy2 = 2
+
+
+# Below this bit length of the modulus, converting to `mpz` and back costs more than it saves,
+#  so `mulModList` stays on `int` even with `IntBackend.gmpy2`.
+GMPY2_MIN_BIT = 256
+
+# Use gmpy2 if it is installed
+backend = IntBackend.gmpy2 if gmpy2 is not None else IntBackend.python
+
+
+def isAvailable(int_backend: IntBackend) -> bool:
+    return int_backend == IntBackend.python or gmpy2 is not None
+
+
+def setBackend(int_backend: IntBackend) -> IntBackend:
+    """
+    Use `int_backend` from now on (for every thread), returns the one used before.
+    """
+    global backend
+    if not isAvailable(int_backend):
+        raise ModuleNotFoundError(f"IntBackend.{int_backend.name} needs the `{int_backend.name}` module.")
+
+    old_backend, backend = backend, int_backend
+    return old_backend
+
+
+def getBackend() -> IntBackend:
+    return backend
+
+
+# Every function takes and returns `int`, so callers never see `mpz`
+
+def mulModList(numbers: list[int], factor: int, mod: int) -> list[int]:
+    """
+    `[x * factor % mod for x in numbers]`, the hot loop of encrypt and decrypt.
+    """
+    if backend == IntBackend.gmpy2 and mod.bit_length() >= GMPY2_MIN_BIT:
+        factor, mod = gmpy2.mpz(factor), gmpy2.mpz(mod)
+        return [int(x * factor % mod) for x in numbers]
+
+    return [x * factor % mod for x in numbers]
+
+
+def powMod(base: int, exponent: int, mod: int) -> int:
+    if backend == IntBackend.gmpy2:
+        return int(gmpy2.powmod(base, exponent, mod))
+
+    return pow(base, exponent, mod)
+
+
+def invert(x: int, mod: int) -> int:
+    """
+    Inverse of `x` under `mod`, raises `ValueError` if there is not.
+    """
+    if backend == IntBackend.gmpy2:
+        try:
+            return int(gmpy2.invert(x, mod))
+        except ZeroDivisionError:
+            raise ValueError("base is not invertible for the given modulus")
+
+    return pow(x, -1, mod)
+
+
+def gcd(a: int, b: int) -> int:
+    if backend == IntBackend.gmpy2:
+        return int(gmpy2.gcd(a, b))
+
+    return pythonGcd(a, b)
@@ -0,0 +1,612 @@
+from cryptfunc import (BlockWidth, Compression, GoldbachKey, EncDecMode, PublicKey, generateKeyGoldbach, getKeyStats,
+                       decryptGoldbachMessage, encryptGoldbachMessage,
+                       decryptGoldbachBatch, encryptForMany, encryptGoldbach, encryptGoldbachBatch, decryptGoldbach,
+                       encryptGoldbachSimple, decryptGoldbachSimple)
+from arithmetic import IntBackend
+from key_directory import MappedPublicKeyDirectory, PublicKeyDirectory, PublicKeyView
+from mathfunc import PrimeBackend, genKeys, genPrime, usePrimeTable
+from prime_table import PrimeTable, buildPrimeTable
+from simulation_entities import User
+from workload import CORPUS_ALPHABETS, getPercentile, makeCorpus
+
+from argparse import ArgumentParser
+from collections.abc import Callable
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import arithmetic
+import json
+import os
+import platform
+import sys
+import tracemalloc
+
+
+DEFAULT_SIZES = [100, 10_000, 1_000_000]
+FULL_SIZES = [100, 10_000, 1_000_000, 10_000_000, 100_000_000]
+DEFAULT_KEYGEN_BITS = [16, 32, 64]
+DEFAULT_DIRECTORY_USERS = [10_000]
+FULL_DIRECTORY_USERS = [10_000, 100_000]
+DEFAULT_KEY_SIZE_BITS = [16, 32, 64]
+DEFAULT_ARITHMETIC_BITS = [64, 256, 1024, 4096]
+# Generating bigger keys with pure Python takes minutes
+ARITHMETIC_KEYGEN_MAX_BIT = 1024
+DEFAULT_FAN_OUT_RECIPIENTS = [1, 10, 100]
+DEFAULT_BATCH_MESSAGE_SIZES = [16, 64, 256]
+DEFAULT_COMPRESSION_SIZES = [200, 100_000]
+# 16 MiB table built in about a second, --full builds the 256 MiB one for every 32 bit prime
+DEFAULT_PRIME_TABLE_BIT = 28
+FULL_PRIME_TABLE_BIT = 32
+# Primes drawn in one run of a "prime_table/draw" case
+PRIME_TABLE_DRAWS = 1000
+GROUPS = ["keygen", "prime", "byte_wise", "char_wise", "user", "directory", "key_size", "arithmetic", "fan_out",
+          "batch", "compression", "prime_table"]
+
+
+def makePayload(kind: str, n_byte: int, *, seed: int = 0) -> bytes:
+    """
+    `n_byte` bytes like what services send: "json" records, "log" lines, or "random" (not compressible).
+    """
+    rng = Random(f"{seed}-payload-{kind}")
+    if kind == "random":
+        return rng.randbytes(n_byte)
+
+    lines = []
+    n_line_byte = 0
+    while n_line_byte < n_byte:
+        match kind:
+            case "json":
+                line = json.dumps({"id": rng.randrange(1 << 32), "user": f"user{rng.randrange(1000)}",
+                                   "action": rng.choice(["login", "logout", "view", "buy"]),
+                                   "amount": round(rng.random() * 100, 2), "ok": rng.random() < 0.9})
+            case "log":
+                line = (f"2024-05-{rng.randrange(1, 29):02d} {rng.randrange(24):02d}:{rng.randrange(60):02d} "
+                        f"{rng.choice(['INFO', 'INFO', 'WARN', 'ERROR'])} worker-{rng.randrange(16)} "
+                        f"handled request {rng.randrange(1 << 20)} in {rng.randrange(500)}ms")
+        lines.append(line)
+        n_line_byte += len(line) + 1
+
+    return "\n".join(lines).encode("utf-8")[:n_byte]
+
+
+def makeKey(*, seed: int = 0, a_bit: int = 16, b_bit: int = 16,
+            block_width: BlockWidth = BlockWidth.maximum) -> GoldbachKey:
+    return generateKeyGoldbach(a_bit=a_bit, b_bit=b_bit, block_width=block_width,
+                               rng=Random(f"{seed}-key-{a_bit}-{b_bit}"))
+
+
+def runCase(name: str, func: Callable[[], object], *,
+            n_repeat: int = 5, n_byte: int = None, measure_memory: bool = True) -> dict:
+    """
+    Run `func` for `n_repeat` times for latency, and once more under `tracemalloc` for peak memory.
+    """
+    latencies = []
+    for _ in range(n_repeat):
+        start = perf_counter()
+        func()
+        latencies.append(perf_counter() - start)
+    latencies.sort()
+
+    result = {
+        "name": name,
+        "n_repeat": n_repeat,
+        "mean_seconds": sum(latencies) / n_repeat,
+        "p50_seconds": getPercentile(latencies, 50),
+        "p90_seconds": getPercentile(latencies, 90),
+        "p99_seconds": getPercentile(latencies, 99),
+    }
+
+    if n_byte is not None:
+        result["n_byte"] = n_byte
+        result["throughput_mb_per_second"] = n_byte / 1e6 / result["p50_seconds"]
+
+    if measure_memory:
+        tracemalloc.start()
+        func()
+        result["peak_memory_byte"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+
+def getRepeatForSize(n_byte: int, n_repeat: int) -> int:
+    # Big inputs take long, and their time is stable enough
+    return n_repeat if n_byte <= 1_000_000 else max(1, n_repeat // 5)
+
+
+def benchKeygen(*, bit_sizes: list[int], n_repeat: int, seed: int) -> list[dict]:
+    result = []
+    for n_bit in bit_sizes:
+        rng = Random(f"{seed}-keygen-{n_bit}")
+        # Retries of every call, to see where the slow calls come from
+        all_stats = []
+
+        def genKeysWithStats():
+            all_stats.append(stats := dict())
+            genKeys(a_bit=n_bit, b_bit=n_bit, rng=rng, stats=stats)
+
+        case = runCase(f"keygen/{n_bit}bit", genKeysWithStats, n_repeat=n_repeat * 10, measure_memory=False)
+        candidates = [x.get("genPrime.candidates", 0) for x in all_stats]
+        case["p99_over_p50"] = case["p99_seconds"] / case["p50_seconds"]
+        case["mean_prime_candidates"] = sum(candidates) / len(candidates)
+        case["max_prime_candidates"] = max(candidates)
+        case["factor_retries"] = sum(x.get("genKeys.factor_retries", 0) for x in all_stats)
+        result.append(case)
+    return result
+
+
+def benchPrimeGeneration(bit_sizes: list[int] = (16, 32, 64, 128, 256, 512), *,
+                         n_repeat: int = 20, seed: int = 0) -> list[dict]:
+    """
+    Only `PrimeBackend.native` takes the seed, `PrimeBackend.rsa` always draws from `os.urandom`.
+    """
+    result = []
+
+    for n_bit in bit_sizes:
+        for backend in PrimeBackend:
+            rng = Random(f"{seed}-prime-{backend.name}-{n_bit}")
+            result.append(runCase(f"prime/{backend.name}/{n_bit}bit",
+                                  lambda: genPrime(n_bit=n_bit, backend=backend, rng=rng),
+                                  n_repeat=n_repeat, measure_memory=False))
+
+    return result
+
+
+def benchByteWise(*, sizes: list[int], n_repeat: int, seed: int) -> list[dict]:
+    goldbach_key = makeKey(seed=seed)
+    result = []
+
+    for kind in CORPUS_ALPHABETS:
+        for n_byte in sizes:
+            message = makeCorpus(kind, n_byte, seed=seed)
+            encrypted = encryptGoldbach(message, goldbach_key.public_key)
+            repeat = getRepeatForSize(n_byte, n_repeat)
+
+            result.append(runCase(f"byte_wise/encrypt/{kind}/{n_byte}B",
+                                  lambda: encryptGoldbach(message, goldbach_key.public_key),
+                                  n_repeat=repeat, n_byte=n_byte))
+            result.append(runCase(f"byte_wise/decrypt/{kind}/{n_byte}B",
+                                  lambda: decryptGoldbach(encrypted, goldbach_key.private_key),
+                                  n_repeat=repeat, n_byte=n_byte))
+
+    return result
+
+
+def benchCharWise(*, sizes: list[int], n_repeat: int, seed: int) -> list[dict]:
+    goldbach_key = makeKey(seed=seed)
+    public_key, private_key = goldbach_key.public_key, goldbach_key.private_key
+    result = []
+
+    for kind in CORPUS_ALPHABETS:
+        # Character should be less than `n`, or it can not be decrypted
+        if max(map(ord, CORPUS_ALPHABETS[kind])) >= private_key.n:
+            continue
+
+        for n_byte in sizes:
+            message = makeCorpus(kind, n_byte, seed=seed)
+            encrypted = encryptGoldbachSimple(message, public_key.a_inv, public_key.b_inv, public_key.k).message
+            repeat = getRepeatForSize(n_byte, n_repeat)
+
+            result.append(runCase(f"char_wise/encrypt/{kind}/{n_byte}B",
+                                  lambda: encryptGoldbachSimple(message, public_key.a_inv, public_key.b_inv,
+                                                                public_key.k),
+                                  n_repeat=repeat, n_byte=n_byte))
+            result.append(runCase(f"char_wise/decrypt/{kind}/{n_byte}B",
+                                  lambda: decryptGoldbachSimple(encrypted, private_key.a, private_key.b,
+                                                                private_key.n),
+                                  n_repeat=repeat, n_byte=n_byte))
+
+    return result
+
+
+def benchUserRoundTrip(*, sizes: list[int], n_repeat: int, seed: int) -> list[dict]:
+    receiver, sender = User("Featherine Augustus Aurora"), User("Beatrice Castiglioni")
+    receiver.addKey(makeKey(seed=seed))
+    receiver.sendPublicKeyTo(sender)
+    result = []
+
+    for n_byte in sizes:
+        message = makeCorpus("ascii", n_byte, seed=seed)
+
+        def roundTrip():
+            encrypted = sender.sendEncMsgTo(receiver.name, message, EncDecMode.byte_wise)
+            return receiver.decryptEncMsg(encrypted, EncDecMode.byte_wise)
+
+        result.append(runCase(f"user/round_trip/ascii/{n_byte}B", roundTrip,
+                              n_repeat=getRepeatForSize(n_byte, n_repeat), n_byte=n_byte))
+
+    return result
+
+
+def benchKeyDirectory(*, user_counts: list[int], n_recipient: int = 20, n_repeat: int, seed: int) -> list[dict]:
+    """
+    Every user knows the same `n_recipient` public keys. Compare own dict per user (each holding
+    its own copy of keys, like received from network) with views of a shared directory.
+    """
+    recipients = {f"Recipient {i}": makeKey(seed=seed * 1000 + i).public_key for i in range(n_recipient)}
+    result = []
+
+    def copyKey(x: PublicKey) -> PublicKey:
+        return PublicKey(x.a_inv, x.b_inv, x.k, x.less_than_n_bit)
+
+    def lookupAll(holders: list) -> None:
+        for holder in holders:
+            for name in recipients:
+                holder[name]
+
+    directory = PublicKeyDirectory()
+    for name, public_key in recipients.items():
+        directory.publish(name, public_key)
+
+    with TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "directory.bin")
+        directory.export(path)
+        mapped = MappedPublicKeyDirectory(path)
+
+        for n_user in user_counts:
+            builders = {
+                "dict": lambda: [{name: copyKey(x) for name, x in recipients.items()} for _ in range(n_user)],
+                "shared": lambda: [PublicKeyView(directory) for _ in range(n_user)],
+                "mapped": lambda: [PublicKeyView(mapped) for _ in range(n_user)],
+            }
+
+            for kind, build in builders.items():
+                # Peak memory of building is the memory of all holders
+                case = runCase(f"directory/build/{kind}/{n_user}users", build, n_repeat=1)
+                result.append(case)
+
+                holders = build()
+                case = runCase(f"directory/lookup/{kind}/{n_user}users", lambda: lookupAll(holders),
+                               n_repeat=n_repeat, measure_memory=False)
+                case["ns_per_lookup"] = case["p50_seconds"] / (n_user * n_recipient) * 1e9
+                result.append(case)
+
+        mapped.close()
+
+    return result
+
+
+def benchKeySize(*, bit_sizes: list[int], n_byte: int = 100_000, n_repeat: int, seed: int) -> list[dict]:
+    """
+    Encrypt and decrypt the same text with each key size and block width policy,
+    with how much the ciphertext grows.
+    """
+    message = makeCorpus("ascii", n_byte, seed=seed)
+    result = []
+
+    for n_bit in bit_sizes:
+        for block_width in BlockWidth:
+            goldbach_key = makeKey(seed=seed, a_bit=n_bit, b_bit=n_bit, block_width=block_width)
+            key_stats = getKeyStats(goldbach_key.public_key)
+            encrypted = encryptGoldbach(message, goldbach_key.public_key)
+            name = f"key_size/{{}}/{n_bit}bit/{block_width.name}"
+
+            for operation, func in (("encrypt", lambda: encryptGoldbach(message, goldbach_key.public_key)),
+                                    ("decrypt", lambda: decryptGoldbach(encrypted, goldbach_key.private_key))):
+                case = runCase(name.format(operation), func, n_repeat=n_repeat, n_byte=n_byte)
+                case["expansion_ratio"] = key_stats["expansion_ratio"]
+                case["blocks_per_kb"] = key_stats["blocks_per_kb"]
+                result.append(case)
+
+    return result
+
+
+def checkBackendEquivalence(goldbach_key: GoldbachKey, message: str, *, seed: int, n_bit: int) -> None:
+    """
+    Every available backend should give the same key from the same seed (if small enough to generate),
+    and the same ciphertext, which decrypts back to `message`.
+    """
+    backends = [x for x in IntBackend if arithmetic.isAvailable(x)]
+    old_backend = arithmetic.getBackend()
+    try:
+        results = []
+        for backend in backends:
+            arithmetic.setBackend(backend)
+            key = makeKey(seed=seed, a_bit=n_bit, b_bit=n_bit) if n_bit <= ARITHMETIC_KEYGEN_MAX_BIT else goldbach_key
+            encrypted = encryptGoldbach(message, key.public_key)
+            # Checkpoint: Every backend gets back the plaintext
+            if decryptGoldbach(encrypted, key.private_key) != message:
+                raise AssertionError(f"IntBackend.{backend.name} failed to decrypt with {n_bit} bit key.")
+            public_key, private_key = key.public_key, key.private_key
+            results.append((public_key.a_inv, public_key.b_inv, public_key.k, public_key.less_than_n_bit,
+                            private_key.a, private_key.b, bytes(encrypted)))
+
+        # Checkpoint: Backends agree with each other
+        for backend, result in zip(backends[1:], results[1:]):
+            if result != results[0]:
+                raise AssertionError(f"IntBackend.{backend.name} differs from IntBackend.{backends[0].name} "
+                                     f"with {n_bit} bit key.")
+    finally:
+        arithmetic.setBackend(old_backend)
+
+
+def benchArithmetic(*, bit_sizes: list[int], n_byte: int = 100_000, n_repeat: int, seed: int) -> list[dict]:
+    """
+    Same keys and text with each available `IntBackend`, after checking that they give the same result.
+    """
+    message = makeCorpus("ascii", n_byte, seed=seed)
+    old_backend = arithmetic.getBackend()
+    result = []
+
+    for n_bit in bit_sizes:
+        # Generate the key with the fastest backend, it is same for every backend anyway
+        goldbach_key = makeKey(seed=seed, a_bit=n_bit, b_bit=n_bit)
+        checkBackendEquivalence(goldbach_key, message, seed=seed, n_bit=n_bit)
+        encrypted = encryptGoldbach(message, goldbach_key.public_key)
+
+        for backend in IntBackend:
+            if not arithmetic.isAvailable(backend):
+                continue
+
+            arithmetic.setBackend(backend)
+            try:
+                if n_bit <= ARITHMETIC_KEYGEN_MAX_BIT:
+                    rng = Random(f"{seed}-arithmetic-{n_bit}")
+                    result.append(runCase(f"arithmetic/{backend.name}/keygen/{n_bit}bit",
+                                          lambda: genKeys(a_bit=n_bit, b_bit=n_bit, rng=rng),
+                                          n_repeat=n_repeat, measure_memory=False))
+                result.append(runCase(f"arithmetic/{backend.name}/encrypt/{n_bit}bit",
+                                      lambda: encryptGoldbach(message, goldbach_key.public_key),
+                                      n_repeat=n_repeat, n_byte=n_byte, measure_memory=False))
+                result.append(runCase(f"arithmetic/{backend.name}/decrypt/{n_bit}bit",
+                                      lambda: decryptGoldbach(encrypted, goldbach_key.private_key),
+                                      n_repeat=n_repeat, n_byte=n_byte, measure_memory=False))
+            finally:
+                arithmetic.setBackend(old_backend)
+
+    return result
+
+
+def benchFanOut(*, recipient_counts: list[int], n_byte: int = 100_000, n_repeat: int, seed: int) -> list[dict]:
+    """
+    One message to many recipients (each with own key of the same size): one `encryptGoldbach`
+    for each of them, against `encryptForMany`. `n_byte` of the cases counts the bytes of every recipient.
+    """
+    message = makeCorpus("ascii", n_byte, seed=seed)
+    result = []
+
+    for n_recipient in recipient_counts:
+        public_keys = {i: makeKey(seed=seed * 1000 + i).public_key for i in range(n_recipient)}
+        result.append(runCase(f"fan_out/each/{n_recipient}recipients",
+                              lambda: [encryptGoldbach(message, x) for x in public_keys.values()],
+                              n_repeat=n_repeat, n_byte=n_byte * n_recipient, measure_memory=False))
+        result.append(runCase(f"fan_out/many/{n_recipient}recipients",
+                              lambda: encryptForMany(message, public_keys),
+                              n_repeat=n_repeat, n_byte=n_byte * n_recipient, measure_memory=False))
+
+    return result
+
+
+def benchBatch(*, message_sizes: list[int], n_message: int = 10_000, n_repeat: int, seed: int) -> list[dict]:
+    """
+    Many small messages to one key: one `encryptGoldbach` (or decrypt) for each of them, against the batch API.
+    """
+    goldbach_key = makeKey(seed=seed)
+    public_key, private_key = goldbach_key.public_key, goldbach_key.private_key
+    result = []
+
+    for size in message_sizes:
+        rng = Random(f"{seed}-batch-{size}")
+        alphabet = CORPUS_ALPHABETS["ascii"]
+        messages = ["".join([rng.choice(alphabet) for _ in range(size)]) for _ in range(n_message)]
+        encrypted = [encryptGoldbach(x, public_key) for x in messages]
+        batch = encryptGoldbachBatch(messages, public_key)
+
+        cases = [
+            ("encrypt/each", lambda: [encryptGoldbach(x, public_key) for x in messages]),
+            ("encrypt/batch", lambda: encryptGoldbachBatch(messages, public_key)),
+            ("decrypt/each", lambda: [decryptGoldbach(x, private_key) for x in encrypted]),
+            ("decrypt/batch", lambda: decryptGoldbachBatch(batch, private_key)),
+        ]
+        for name, func in cases:
+            case = runCase(f"batch/{name}/{n_message}x{size}B", func,
+                           n_repeat=n_repeat, n_byte=size * n_message, measure_memory=False)
+            case["messages_per_second"] = n_message / case["p50_seconds"]
+            result.append(case)
+
+    return result
+
+
+def benchCompression(*, sizes: list[int], n_repeat: int, seed: int) -> list[dict]:
+    """
+    Round trip (compress, encrypt, decrypt, decompress) with each compression, and how many blocks it makes.
+    """
+    goldbach_key = makeKey(seed=seed)
+    public_key, private_key = goldbach_key.public_key, goldbach_key.private_key
+    result = []
+
+    for kind in ("json", "log", "random"):
+        for n_byte in sizes:
+            payload = makePayload(kind, n_byte, seed=seed)
+            for compression in Compression:
+                enc_message = encryptGoldbachMessage(payload, public_key, compression=compression)
+                case = runCase(f"compression/{kind}/{compression.name}/{n_byte}B",
+                               lambda: decryptGoldbachMessage(encryptGoldbachMessage(payload, public_key,
+                                                                                     compression=compression),
+                                                              private_key, encoding=None),
+                               n_repeat=n_repeat, n_byte=n_byte, measure_memory=False)
+                case["n_block"] = len(enc_message.message)
+                case["compression_used"] = enc_message.compression.name
+                result.append(case)
+
+    return result
+
+
+def benchPrimeTable(*, max_bit: int, n_repeat: int, seed: int) -> list[dict]:
+    """
+    Build a prime table, then draw primes and generate keys with and without it.
+    """
+    result = []
+    with TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "primes.gbpt")
+        build = runCase(f"prime_table/build/{max_bit}bit", lambda: buildPrimeTable(path, max_bit=max_bit), n_repeat=1)
+        build["file_byte"] = os.path.getsize(path)
+        result.append(build)
+
+        draw_bits = sorted({x for x in (16, 24, max_bit) if 12 <= x <= max_bit})
+        keygen_bits = sorted({16, min(32, max_bit)})
+        with PrimeTable(path) as table:
+            for use_table in (False, True):
+                # Give the caller's table back after
+                previous_table = usePrimeTable(table if use_table else None)
+                name = "table" if use_table else "native"
+                try:
+                    for n_bit in draw_bits:
+                        rng = Random(f"{seed}-prime-table-{n_bit}")
+                        case = runCase(f"prime_table/draw/{name}/{n_bit}bit",
+                                       lambda: [genPrime(n_bit=n_bit, rng=rng) for _ in range(PRIME_TABLE_DRAWS)],
+                                       n_repeat=n_repeat, measure_memory=False)
+                        case["draws_per_second"] = PRIME_TABLE_DRAWS / case["p50_seconds"]
+                        result.append(case)
+
+                    for n_bit in keygen_bits:
+                        rng = Random(f"{seed}-prime-table-keygen-{n_bit}")
+                        result.append(runCase(f"prime_table/keygen/{name}/{n_bit}bit",
+                                              lambda: genKeys(a_bit=n_bit, b_bit=n_bit, rng=rng),
+                                              n_repeat=n_repeat * 20, measure_memory=False))
+                finally:
+                    usePrimeTable(previous_table)
+
+    return result
+
+
+def runBenchmark(*, groups: list[str] = GROUPS, sizes: list[int] = DEFAULT_SIZES,
+                 keygen_bits: list[int] = DEFAULT_KEYGEN_BITS, directory_users: list[int] = DEFAULT_DIRECTORY_USERS,
+                 key_size_bits: list[int] = DEFAULT_KEY_SIZE_BITS,
+                 arithmetic_bits: list[int] = DEFAULT_ARITHMETIC_BITS,
+                 fan_out_recipients: list[int] = DEFAULT_FAN_OUT_RECIPIENTS,
+                 batch_message_sizes: list[int] = DEFAULT_BATCH_MESSAGE_SIZES,
+                 compression_sizes: list[int] = DEFAULT_COMPRESSION_SIZES,
+                 prime_table_bit: int = DEFAULT_PRIME_TABLE_BIT,
+                 n_repeat: int = 5, seed: int = 0,
+                 log: Callable[[str], None] = None) -> dict:
+    cases = []
+    for group in groups:
+        match group:
+            case "keygen": group_result = benchKeygen(bit_sizes=keygen_bits, n_repeat=n_repeat, seed=seed)
+            case "prime": group_result = benchPrimeGeneration(n_repeat=n_repeat * 4, seed=seed)
+            case "byte_wise": group_result = benchByteWise(sizes=sizes, n_repeat=n_repeat, seed=seed)
+            case "char_wise": group_result = benchCharWise(sizes=sizes, n_repeat=n_repeat, seed=seed)
+            case "user": group_result = benchUserRoundTrip(sizes=sizes, n_repeat=n_repeat, seed=seed)
+            case "directory":
+                group_result = benchKeyDirectory(user_counts=directory_users, n_repeat=n_repeat, seed=seed)
+            case "key_size": group_result = benchKeySize(bit_sizes=key_size_bits, n_repeat=n_repeat, seed=seed)
+            case "arithmetic":
+                group_result = benchArithmetic(bit_sizes=arithmetic_bits, n_repeat=n_repeat, seed=seed)
+            case "fan_out":
+                group_result = benchFanOut(recipient_counts=fan_out_recipients, n_repeat=n_repeat, seed=seed)
+            case "batch":
+                group_result = benchBatch(message_sizes=batch_message_sizes, n_repeat=n_repeat, seed=seed)
+            case "compression":
+                group_result = benchCompression(sizes=compression_sizes, n_repeat=n_repeat, seed=seed)
+            case "prime_table":
+                group_result = benchPrimeTable(max_bit=prime_table_bit, n_repeat=n_repeat, seed=seed)
+            case _: raise ValueError(f"Unknown benchmark group \"{group}\".")
+
+        if log is not None:
+            for case in group_result:
+                log(formatCase(case))
+        cases += group_result
+
+    return {
+        "seed": seed,
+        "python": platform.python_version(),
+        "int_backend": arithmetic.getBackend().name,
+        "platform": platform.platform(),
+        "cases": cases
+    }
+
+
+def formatCase(case: dict) -> str:
+    line = f"{case['name']:<40} p50 {case['p50_seconds'] * 1e3:>10.3f}ms  p99 {case['p99_seconds'] * 1e3:>10.3f}ms"
+    if "throughput_mb_per_second" in case:
+        line += f"  {case['throughput_mb_per_second']:>8.3f}MB/s"
+    if "peak_memory_byte" in case:
+        line += f"  peak {case['peak_memory_byte'] / 1e6:>8.3f}MB"
+    if "ns_per_lookup" in case:
+        line += f"  {case['ns_per_lookup']:>8.1f}ns/lookup"
+    if "messages_per_second" in case:
+        line += f"  {case['messages_per_second']:>10.0f}msg/s"
+    if "n_block" in case:
+        line += f"  {case['n_block']:>8} blocks ({case['compression_used']})"
+    if "file_byte" in case:
+        line += f"  file {case['file_byte'] / (1 << 20):.1f}MiB"
+    if "draws_per_second" in case:
+        line += f"  {case['draws_per_second']:>10.0f}draw/s"
+    if "p99_over_p50" in case:
+        line += (f"  p99/p50 {case['p99_over_p50']:.2f}  {case['mean_prime_candidates']:.1f} candidates "
+                 f"(max {case['max_prime_candidates']})  {case['factor_retries']} factor retries")
+    if "expansion_ratio" in case:
+        line += f"  x{case['expansion_ratio']:.3f} size  {case['blocks_per_kb']} blocks/KB"
+    return line
+
+
+def compareWithBaseline(report: dict, baseline: dict, *, tolerance: float = 0.25) -> list[str]:
+    """
+    Names (and how much slower) of cases whose p50 latency is more than `tolerance` slower than the baseline.
+    """
+    baseline_cases = {case["name"]: case for case in baseline["cases"]}
+    regressions = []
+
+    for case in report["cases"]:
+        if case["name"] not in baseline_cases:
+            continue
+
+        ratio = case["p50_seconds"] / baseline_cases[case["name"]]["p50_seconds"]
+        if ratio > 1 + tolerance:
+            regressions.append(f"{case['name']}: {ratio:.2f}x of baseline")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark of GoldbachEnc.")
+    parser.add_argument("--groups", default=",".join(GROUPS), help=f"Comma separated, from {', '.join(GROUPS)}.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma separated bytes.")
+    parser.add_argument("--full", action="store_true", help=f"Use sizes {FULL_SIZES}.")
+    parser.add_argument("--keygen-bits", default=",".join(map(str, DEFAULT_KEYGEN_BITS)))
+    parser.add_argument("--key-size-bits", default=",".join(map(str, DEFAULT_KEY_SIZE_BITS)))
+    parser.add_argument("--arithmetic-bits", default=",".join(map(str, DEFAULT_ARITHMETIC_BITS)))
+    parser.add_argument("--fan-out-recipients", default=",".join(map(str, DEFAULT_FAN_OUT_RECIPIENTS)))
+    parser.add_argument("--batch-message-sizes", default=",".join(map(str, DEFAULT_BATCH_MESSAGE_SIZES)))
+    parser.add_argument("--compression-sizes", default=",".join(map(str, DEFAULT_COMPRESSION_SIZES)))
+    parser.add_argument("--prime-table-bit", type=int, default=DEFAULT_PRIME_TABLE_BIT,
+                        help=f"Bits covered by the prime table, --full uses {FULL_PRIME_TABLE_BIT}.")
+    parser.add_argument("--int-backend", choices=[x.name for x in IntBackend],
+                        help="Backend of the other groups, gmpy2 if installed by default.")
+    parser.add_argument("--directory-users", default=",".join(map(str, DEFAULT_DIRECTORY_USERS)),
+                        help=f"Comma separated, --full uses {FULL_DIRECTORY_USERS}.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this file.")
+    parser.add_argument("--baseline", help="JSON report to compare with, exit with 1 if any case regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slow down, 0.25 means 25%%.")
+    args = parser.parse_args()
+
+    if args.int_backend is not None:
+        arithmetic.setBackend(IntBackend[args.int_backend])
+
+    report = runBenchmark(groups=args.groups.split(","),
+                          sizes=FULL_SIZES if args.full else [int(x) for x in args.sizes.split(",")],
+                          keygen_bits=[int(x) for x in args.keygen_bits.split(",")],
+                          directory_users=FULL_DIRECTORY_USERS if args.full
+                          else [int(x) for x in args.directory_users.split(",")],
+                          key_size_bits=[int(x) for x in args.key_size_bits.split(",")],
+                          arithmetic_bits=[int(x) for x in args.arithmetic_bits.split(",")],
+                          fan_out_recipients=[int(x) for x in args.fan_out_recipients.split(",")],
+                          batch_message_sizes=[int(x) for x in args.batch_message_sizes.split(",")],
+                          compression_sizes=[int(x) for x in args.compression_sizes.split(",")],
+                          prime_table_bit=FULL_PRIME_TABLE_BIT if args.full else args.prime_table_bit,
+                          n_repeat=args.repeat, seed=args.seed, log=print)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compareWithBaseline(report, json.load(f), tolerance=args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if len(regressions) > 0 else 0)
@@ -1,12 +1,30 @@
-from str_manip import BitExtracter, StringBuffer, StringMakerFromBytes
-from mathfunc import genKeys, getSafeRandomInt
+from str_manip import BitExtracter, BlockPacker, BlockUnpacker, StringBuffer, StringMakerFromBytes
+from mathfunc import PrimeBackend, genKeys, getSafeRandomInt
 
-from collections import deque
-from collections.abc import MutableSequence
+from collections import OrderedDict, deque
+from array import array
+from bisect import bisect_right
+from collections.abc import Hashable, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import Executor
+from itertools import islice
+from codecs import getincrementaldecoder
 from enum import Enum
+from random import Random
+from sys import byteorder
+from threading import Lock
+from typing import BinaryIO
+
+import arithmetic
+import instrument
+import lzma
+import mmap
+import zlib
 
 
 class PublicKey:
+    # Many users may hold the same public keys, so keep each instance small
+    __slots__ = ("a_inv", "b_inv", "k", "less_than_n_bit")
+
     def __init__(self, a_inv: int, b_inv: int, k: int, less_than_n_bit: int) -> None:
         self.a_inv = a_inv
         self.b_inv = b_inv
@@ -35,10 +53,133 @@ class GoldbachKey:
         self.private_key = private_key
 
 
+def getBlockWidth(k: int) -> int:
+    """
+    Bytes needed for one encrypted block, which is always less than `k`.
+    """
+    return (k.bit_length() + 7) // 8
+
+
+class BlockArray(Sequence[int]):
+    """
+    Encrypted blocks stored in one buffer, each takes exact `width` bytes in little-endian.
+    Blocks are only turned into `int` when indexed or iterated.
+
+    `data` can be any bytes-like object, like a slice of a memory-mapped file or of a received frame,
+    then it is used as it is (but `append` and `extend` need a `bytearray`).
+    """
+
+    __slots__ = ("width", "data")
+
+    # Blocks converted at a time when iterating or extending
+    iter_chunk = 4096
+
+    def __init__(self, width: int, data: bytes | bytearray | memoryview = None) -> None:
+        self.width = width
+        self.data = bytearray() if data is None else data
+
+    @staticmethod
+    def fromBlocks(blocks: Iterable[int], width: int) -> "BlockArray":
+        result = BlockArray(width)
+        result.extend(blocks)
+        return result
+
+    def __len__(self) -> int:
+        return len(self.data) // self.width
+
+    def __getitem__(self, i: int | slice) -> "int | BlockArray":
+        width = self.width
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step == 1:
+                return BlockArray(width, self.data[start * width:max(start, stop) * width])
+            return BlockArray.fromBlocks([self[j] for j in range(start, stop, step)], width)
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Block index {i} out of range of {len(self)} blocks.")
+
+        return int.from_bytes(self.data[i * width:(i + 1) * width], "little")
+
+    def __iter__(self) -> Iterator[int]:
+        # Convert a chunk at a time, so a big message is not turned into `int` at once
+        for start in range(0, len(self), BlockArray.iter_chunk):
+            yield from self.toList(start, start + BlockArray.iter_chunk)
+
+    def toList(self, start: int = 0, stop: int = None) -> list[int]:
+        """
+        Blocks in `[start, stop)` as `int`.
+
+        Every 8 bytes of the blocks are spread into their own 8 byte slots by strided slice copies,
+        then read at once as native unsigned integers, which is much faster than `int.from_bytes` for each.
+        """
+        width = self.width
+        stop = len(self) if stop is None else min(stop, len(self))
+        n_block = max(0, stop - start)
+        data = self.data[start * width:start * width + n_block * width]
+
+        if byteorder != "little":
+            return [int.from_bytes(data[i:i + width], "little") for i in range(0, len(data), width)]
+
+        result: list[int] = None
+        for limb_start in range(0, width, 8):
+            widened = bytearray(n_block * 8)
+            for j in range(min(8, width - limb_start)):
+                widened[j::8] = data[limb_start + j::width]
+            limbs = memoryview(widened).cast("Q").tolist()
+
+            if result is None:
+                result = limbs
+            else:
+                result = [x | y << (limb_start * 8) for x, y in zip(result, limbs)]
+
+        return result or []
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, BlockArray):
+            return self.width == other.width and self.data == other.data
+        if isinstance(other, Iterable):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"BlockArray(width={self.width}, n_block={len(self)})"
+
+    def append(self, x: int) -> None:
+        self.data += x.to_bytes(self.width, "little")
+
+    def extend(self, blocks: Iterable[int]) -> None:
+        width = self.width
+        blocks = iter(blocks)
+        # A chunk at a time, so there are not too many small `bytes` alive together
+        while len(chunk := list(islice(blocks, BlockArray.iter_chunk))) > 0:
+            self.data += b"".join([x.to_bytes(width, "little") for x in chunk])
+
+    def memoryview(self) -> memoryview:
+        """
+        The blocks as bytes without copying, like for `socket.send` or `file.write`.
+        """
+        return memoryview(self.data)
+
+    def __bytes__(self) -> bytes:
+        return bytes(self.data)
+
+
+class Compression(Enum):
+    none = 1
+    zlib = 2
+    lzma = 3
+    # Choose one by the data (see `chooseCompression`), the message records the one really used
+    adaptive = 4
+
+
 class GoldbachEncMessage:
-    def __init__(self, message: MutableSequence[int], k: int) -> None:
+    def __init__(self, message: Sequence[int], k: int, *, compression: Compression = Compression.none) -> None:
         self.message = message
         self.k = k
+        # How the plaintext was compressed before encrypting, decrypt should undo it
+        self.compression = compression
 
     def __str__(self) -> str:
         return ""                                                                                 \
@@ -46,52 +187,432 @@ class GoldbachEncMessage:
             + f"\tMessage preview: {', '.join([str(self.message[i]) for i in range(5)])}.\n"
 
 
+class GoldbachEncBatch(Sequence[GoldbachEncMessage]):
+    """
+    Many messages encrypted with one key. Blocks of every message are in one `BlockArray`,
+    message `i` is the blocks from `offsets[i]` to `offsets[i + 1]`.
+    """
+
+    __slots__ = ("blocks", "offsets", "k")
+
+    def __init__(self, blocks: BlockArray, offsets: array, k: int) -> None:
+        self.blocks = blocks
+        self.offsets = offsets
+        self.k = k
+
+    @staticmethod
+    def concat(batches: Sequence["GoldbachEncBatch"]) -> "GoldbachEncBatch":
+        """
+        Join batches of the same key, in order.
+        """
+        blocks = BlockArray(batches[0].blocks.width)
+        offsets = array("Q", [0])
+        for batch in batches:
+            base = len(blocks)
+            blocks.data += batch.blocks.data
+            offsets.extend([x + base for x in batch.offsets[1:]])
+
+        return GoldbachEncBatch(blocks, offsets, batches[0].k)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int | slice) -> "GoldbachEncMessage | GoldbachEncBatch":
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                raise ValueError("GoldbachEncBatch can only be sliced with step 1.")
+            stop = max(start, stop)
+            base = self.offsets[start]
+            return GoldbachEncBatch(self.blocks[base:self.offsets[stop]],
+                                    array("Q", [x - base for x in self.offsets[start:stop + 1]]), self.k)
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("GoldbachEncBatch index out of range")
+        return GoldbachEncMessage(self.blocks[self.offsets[i]:self.offsets[i + 1]], self.k)
+
+    def __repr__(self) -> str:
+        return f"GoldbachEncBatch(n_message={len(self)}, n_block={len(self.blocks)}, k={self.k})"
+
+
 class EncDecMode(Enum):
     char_wise = 1
     byte_wise = 2
+    # Binary data as it is, no text encoding (decrypt gives `bytes`)
+    binary = 3
+
+
+class BlockWidth(Enum):
+    # Widest block the key can decrypt, least blocks (and multiplies) for a message
+    maximum = 1
+    # Random width (at least 10 bit), the original way
+    random = 2
+
+
+class BlockEngine(Enum):
+    # Extract (or join) list of bits by `BitExtracter`, the original way
+    bit_list = 1
+    # Cut (or join) blocks by `BlockPacker` and `BlockUnpacker` with shifts
+    int_shift = 2
+
+
+class BlockCipherCache:
+    """
+    Bounded LRU memo of block (or character) encrypt/decrypt results under one key.
+    Entries are looked up by `(direction, parity, value)`, so both directions
+    and both `EncDecMode` can share one cache.
+
+    Use one instance per key, since the result is only valid for that key.
+    Can be shared by threads (like the executor of a messaging service).
+    """
+
+    encrypt = 0
+    decrypt = 1
+
+    def __init__(self, capacity: int = 4096) -> None:
+        if capacity < 1:
+            raise ValueError(f"Capacity of the cache should be at least 1, but got {capacity}.")
+
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries: OrderedDict[tuple[int, int, int], int] = OrderedDict()
+        # Reordering and evicting are not atomic, another thread could evict the entry being moved
+        self.__lock = Lock()
+
+    def get(self, direction: int, parity: int, value: int) -> int | None:
+        with self.__lock:
+            result = self.__entries.get((direction, parity, value))
+
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.__entries.move_to_end((direction, parity, value))
+
+        return result
+
+    def put(self, direction: int, parity: int, value: int, result: int) -> int:
+        with self.__lock:
+            self.__entries[(direction, parity, value)] = result
+
+            if len(self.__entries) > self.capacity:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+        return result
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def getStats(self) -> dict[str, int | float]:
+        n_lookup = self.hits + self.misses
+        return {
+            "capacity": self.capacity,
+            "size": len(self.__entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / n_lookup if n_lookup > 0 else 0.0
+        }
+
+
+class KeyContext:
+    """
+    Everything that encrypt/decrypt of `BlockEngine.int_shift` needs from one key, computed once.
+    Build it from the public key to encrypt, and give the private key also to decrypt.
+    """
+
+    def __init__(self, public_key: PublicKey, private_key: PrivateKey = None) -> None:
+        self.public_key = public_key
+        self.private_key = private_key
+
+        self.k = public_key.k
+        self.less_than_n_bit = public_key.less_than_n_bit
+        # Since we add one more bit before the extract bit, so block has `less_than_n_bit - 1` bits
+        self.n_bit = public_key.less_than_n_bit - 1
+        self.encrypt_multipliers = (public_key.a_inv, public_key.b_inv)
+        # Every block is at least 1 (the leading one), so if `a_inv` and `b_inv` are not less than `k`,
+        #  "multiply result is less than k" never happens, no need to check it for each block.
+        self.need_check = min(public_key.a_inv, public_key.b_inv) < public_key.k
+
+        if private_key is not None:
+            self.n = private_key.n
+            self.decrypt_multipliers = (private_key.a, private_key.b)
+
+    def encryptBlocks(self, blocks: list[int], *, start_at: int = 0,
+                      cache: BlockCipherCache = None) -> list[int]:
+        if self.need_check or cache is not None:
+            return encryptBlocks(blocks, *self.encrypt_multipliers, self.k, start_at=start_at, cache=cache)
+
+        even, odd = self.encrypt_multipliers if start_at % 2 == 0 else self.encrypt_multipliers[::-1]
+        k = self.k
+        encrypt_result = [0] * len(blocks)
+        with instrument.stage("encrypt.multiply_mod") as stage:
+            encrypt_result[0::2] = arithmetic.mulModList(blocks[0::2], even, k)
+            encrypt_result[1::2] = arithmetic.mulModList(blocks[1::2], odd, k)
+            stage.addWork(n_block=len(blocks))
+
+        return encrypt_result
+
+    def encrypt(self, message: str, *, encoding: str = "utf-8", cache: BlockCipherCache = None) -> BlockArray:
+        """
+        Same result as `encryptGoldbach`.
+        """
+        return self.encryptBytes(str(message).encode(encoding), cache=cache)
+
+    def encryptBytes(self, data: bytes | bytearray | memoryview | mmap.mmap, *,
+                     cache: BlockCipherCache = None) -> BlockArray:
+        """
+        Same result as `encryptGoldbachBytes`.
+        """
+        packer = BlockPacker(self.n_bit)
+        with asByteView(data) as view:
+            blocks = packer.feed(view) + packer.finish()
+
+        return BlockArray.fromBlocks(self.encryptBlocks(blocks, cache=cache), getBlockWidth(self.k))
+
+    def decrypt(self, message: Iterable[int], *, encoding: str = "utf-8", cache: BlockCipherCache = None) -> str:
+        """
+        Same result as `decryptGoldbach`, and does not consume `message` also.
+        """
+        plain = self.decryptBytes(message, cache=cache)
+        with instrument.stage("decrypt.decode") as stage:
+            stage.addWork(n_byte=len(plain))
+            return plain.decode(encoding)
+
+    def decryptBytes(self, message: Iterable[int], *, cache: BlockCipherCache = None) -> bytes:
+        if self.private_key is None:
+            raise KeyError(f"Context of key k = {self.k} has no private key to decrypt.")
+
+        if cache is not None:
+            return decryptGoldbachBytes(message, self.private_key, cache=cache)
+
+        blocks = message.toList() if isinstance(message, BlockArray) else list(message)
+        even, odd = self.decrypt_multipliers
+        n = self.n
+        plain_blocks = [0] * len(blocks)
+        with instrument.stage("decrypt.multiply_mod") as stage:
+            # Same as `x % n * a % n`, since `(x % n) * a` and `x * a` are same under mod n
+            plain_blocks[0::2] = arithmetic.mulModList(blocks[0::2], even, n)
+            plain_blocks[1::2] = arithmetic.mulModList(blocks[1::2], odd, n)
+            stage.addWork(n_block=len(blocks))
+
+        # Bits less than one byte are the trailing zero, they are already dropped
+        return bytes(BlockUnpacker().feed(plain_blocks))
+
+
+# Messages of these types are encrypted as their bytes, anything else as its `str`
+BYTES_LIKE = (bytes, bytearray, memoryview, mmap.mmap)
+
+
+def asByteView(data: bytes | bytearray | memoryview | mmap.mmap) -> memoryview:
+    """
+    View `data` as unsigned bytes without copying. Release the view (by `with`) before closing an `mmap`.
+    """
+    return memoryview(data).cast("B")
+
+
+# Smaller than this, compression header costs more than it saves
+COMPRESS_MIN_BYTE = 128
+# `Compression.adaptive` tries the fastest zlib on this much of the data first,
+#  and does not compress if it is not smaller than this ratio
+COMPRESS_SAMPLE_BYTE = 4096
+COMPRESS_MAX_RATIO = 0.9
+ZLIB_LEVEL = 6
+LZMA_PRESET = 6
+# Decompressed payload is never let grow larger than this, a tiny crafted payload could inflate to gigabytes
+DECOMPRESS_MAX_BYTE = 1 << 30
+
+
+def chooseCompression(data: bytes | bytearray | memoryview | mmap.mmap) -> Compression:
+    if len(data) < COMPRESS_MIN_BYTE:
+        return Compression.none
+
+    sample = data[:COMPRESS_SAMPLE_BYTE]
+    if len(zlib.compress(sample, 1)) > len(sample) * COMPRESS_MAX_RATIO:
+        return Compression.none
+
+    return Compression.zlib
+
+
+def compressPayload(data: bytes | bytearray | memoryview | mmap.mmap,
+                    compression: Compression) -> tuple[bytes | bytearray | memoryview | mmap.mmap, Compression]:
+    """
+    Compressed `data`, and the compression really used (never `Compression.adaptive`).
+    `data` is given back as it is if the compressed one is not smaller.
+    """
+    if compression == Compression.adaptive:
+        compression = chooseCompression(data)
+    if compression == Compression.none:
+        return data, compression
+
+    with instrument.stage(f"compress.{compression.name}") as stage:
+        match compression:
+            case Compression.zlib:
+                compressed = zlib.compress(data, ZLIB_LEVEL)
+            case Compression.lzma:
+                compressed = lzma.compress(data, preset=LZMA_PRESET)
+        stage.addWork(n_byte=len(data))
 
+    if len(compressed) >= len(data):
+        return data, Compression.none
+    return compressed, compression
 
-def generateKeyGoldbach():
-    a, b, n, a_inv, b_inv, k = genKeys()
 
-    # Give a random safe bit length
+def decompressPayload(data: bytes, compression: Compression, *, max_byte: int = DECOMPRESS_MAX_BYTE) -> bytes:
+    """
+    Reverse of `compressPayload`. Raises `ValueError` if the result would be more than `max_byte` bytes,
+    without decompressing more than that.
+    """
+    with instrument.stage(f"decompress.{compression.name}") as stage:
+        match compression:
+            case Compression.none:
+                return data
+            case Compression.zlib:
+                decompressor = zlib.decompressobj()
+                # One more byte than the limit tells whether there is more
+                result = decompressor.decompress(data, max_byte + 1)
+            case Compression.lzma:
+                decompressor = lzma.LZMADecompressor()
+                result = decompressor.decompress(data, max_length=max_byte + 1)
+            case _:
+                raise ValueError(f"{compression} is not a compression of a message.")
+        stage.addWork(n_byte=len(result))
+
+    if len(result) > max_byte:
+        raise ValueError(f"Decompressed payload is more than the limit {max_byte} bytes.")
+    if not decompressor.eof:
+        raise ValueError(f"{compression.name} payload is truncated.")
+    return result
+
+
+def encryptGoldbachMessage(message: str | bytes | bytearray | memoryview | mmap.mmap, public_key: PublicKey, *,
+                           encoding: str = "utf-8",
+                           compression: Compression = Compression.adaptive) -> GoldbachEncMessage:
+    """
+    Compress, then encrypt like `encryptGoldbach`. The compression is recorded in the result.
+    """
+    if not isinstance(message, BYTES_LIKE):
+        message = str(message).encode(encoding)
+
+    data, compression = compressPayload(message, compression)
+    return GoldbachEncMessage(encryptGoldbachBytes(data, public_key), public_key.k, compression=compression)
+
+
+def decryptGoldbachMessage(enc_message: GoldbachEncMessage, private_key: PrivateKey, *,
+                           encoding: str = "utf-8") -> str | bytes:
+    """
+    Reverse of `encryptGoldbachMessage`, gives `bytes` if `encoding` is `None`.
+    """
+    plain = decompressPayload(decryptGoldbachBytes(enc_message.message, private_key), enc_message.compression)
+    return plain if encoding is None else plain.decode(encoding)
+
+
+def generateKeyGoldbach(*, a_bit: int = 16, b_bit: int = 16,
+                        block_width: BlockWidth = BlockWidth.maximum,
+                        prime_backend: PrimeBackend = PrimeBackend.native, rng: Random = None):
+    """
+    `a_bit` and `b_bit` are the sizes of the secret primes, bigger is harder to break but slower.
+    `block_width` decides `less_than_n_bit`, see `BlockWidth`.
+    """
+    # `rng` is only for reproducible keys (like benchmark), do not use it for real keys
+    a, b, n, a_inv, b_inv, k = genKeys(a_bit=a_bit, b_bit=b_bit, prime_backend=prime_backend, rng=rng)
+
+    # A block (with its leading one) of `n.bit_length() - 1` bits is always less than `n`,
+    #  so it is the widest block that can be decrypted.
+    # It also makes sure that this length message, times `a_inv` or `b_inv`, will bigger than `k`,
+    #  since `a_inv` and `b_inv` are bigger than `k`.
     n_bit_length = n.bit_length()
-    # More than 10 bit will be safe ?
-    # Also make sure that this length message, times `a_inv` or `b_inv`, will bigger than `k`
-    # Maybe it can be reached by having a big `a_inv` and `b_inv` which is bigger than `k` ?
-    less_than_n_bit = getSafeRandomInt(10, n_bit_length - 1)
+    match block_width:
+        case BlockWidth.maximum:
+            less_than_n_bit = n_bit_length - 1
+        case BlockWidth.random:
+            # More than 10 bit will be safe ?
+            less_than_n_bit = getSafeRandomInt(min(10, n_bit_length - 1), n_bit_length - 1, rng=rng)
 
     return GoldbachKey(PublicKey(a_inv, b_inv, k, less_than_n_bit), PrivateKey(a, b))
 
 
-def encryptGoldbachSimple(message: str, a_inv: int, b_inv: int, k: int) -> tuple[list[int], int]:
+def getKeyStats(public_key: PublicKey) -> dict[str, int | float]:
+    """
+    How much the ciphertext grows with this key. `expansion_ratio` is ciphertext bits
+    (stored in `getBlockWidth` bytes per block) per plaintext bit.
+    """
+    payload_n_bit = public_key.less_than_n_bit - 1
+    block_n_byte = getBlockWidth(public_key.k)
+    return {
+        "k_bit": public_key.k.bit_length(),
+        "payload_bit": payload_n_bit,
+        "block_byte": block_n_byte,
+        "expansion_ratio": block_n_byte * 8 / payload_n_bit,
+        "blocks_per_kb": BlockPacker.countBlocks(1024, payload_n_bit),
+    }
+
+
+def encryptGoldbachSimple(message: str, a_inv: int, b_inv: int, k: int, *,
+                          cache: BlockCipherCache = None) -> GoldbachEncMessage:
     len_message = len(message)
     result = [0] * len_message
 
-    for i in range(len_message):
-        result[i] = ord(message[i]) * (a_inv if i % 2 == 0 else b_inv) % k
+    if cache is None:
+        for i in range(len_message):
+            result[i] = ord(message[i]) * (a_inv if i % 2 == 0 else b_inv) % k
+    else:
+        for i in range(len_message):
+            x = ord(message[i])
+            if (encrypted := cache.get(BlockCipherCache.encrypt, i & 1, x)) is None:
+                encrypted = cache.put(BlockCipherCache.encrypt, i & 1, x, x * (a_inv if i % 2 == 0 else b_inv) % k)
+            result[i] = encrypted
 
     return GoldbachEncMessage(result, k)
 
 
-def decryptGoldbachSimple(message: list[int], a: int, b: int, n: int) -> str:
+def decryptGoldbachSimple(message: list[int], a: int, b: int, n: int, *,
+                          cache: BlockCipherCache = None) -> str:
     len_message = len(message)
     result = [""] * len_message
 
-    for i in range(len_message):
-        result[i] = (message[i] % n * (a if i % 2 == 0 else b)) % n
+    if cache is None:
+        for i in range(len_message):
+            result[i] = (message[i] % n * (a if i % 2 == 0 else b)) % n
+    else:
+        for i in range(len_message):
+            x = message[i]
+            if (decrypted := cache.get(BlockCipherCache.decrypt, i & 1, x)) is None:
+                decrypted = cache.put(BlockCipherCache.decrypt, i & 1, x, (x % n * (a if i % 2 == 0 else b)) % n)
+            result[i] = decrypted
 
     return "".join(map(lambda x: chr(int(x)), result))
 
 
-def encryptGoldbach(message: str, public_key: PublicKey, *, encoding: str = "utf-8") -> deque[int]:
+def encryptGoldbach(message: str | bytes | bytearray | memoryview | mmap.mmap, public_key: PublicKey, *,
+                    encoding: str = "utf-8",
+                    engine: BlockEngine = BlockEngine.int_shift,
+                    cache: BlockCipherCache = None) -> BlockArray:
     # Use block cipher method to encode, block size is `less_than_n_bit`.
+    # `cache` is only used by `BlockEngine.int_shift`.
+    # Binary `message` is encrypted as it is by `encryptGoldbachBytes` (`encoding` and `engine` are not used).
+    if isinstance(message, BYTES_LIKE):
+        return encryptGoldbachBytes(message, public_key, cache=cache)
+
     i = 0
     a_inv = public_key.a_inv
     b_inv = public_key.b_inv
     k = public_key.k
     less_than_n_bit = public_key.less_than_n_bit
 
+    if engine == BlockEngine.int_shift:
+        return encryptGoldbachIntShift(str(message).encode(encoding), a_inv, b_inv, k, less_than_n_bit,
+                                       cache=cache)
+
     extracter = BitExtracter(message)
     encrypt_result = deque(maxlen=int(extracter.getApproxSizeInBit() / less_than_n_bit) + 10)
 
@@ -106,7 +627,9 @@ def encryptGoldbach(message: str, public_key: PublicKey, *, encoding: str = "utf
 
         # Add leading one to the bit, to avoid the loss of leading zero when decrypting
         number_from_bits = BitExtracter.bitsToNumber([1] + bits_extracted)
-        number_multiplied = number_from_bits * (a_inv if i % 2 == 0 else b_inv)
+        with instrument.stage("encrypt.multiply_mod") as stage:
+            number_multiplied = number_from_bits * (a_inv if i % 2 == 0 else b_inv)
+            stage.addWork(n_block=1)
 
         # Checkpoint: If failed, it implies the a_inv or b_inv is still too small
         if number_multiplied < k:
@@ -120,15 +643,167 @@ def encryptGoldbach(message: str, public_key: PublicKey, *, encoding: str = "utf
 
     # At now, either string exhausted (need add trailing zero), or end normally
     # Leave this question to decrypt, first send it through network
+    return BlockArray.fromBlocks(encrypt_result, getBlockWidth(k))
+
+
+def encryptGoldbachBytes(data: bytes | bytearray | memoryview | mmap.mmap, public_key: PublicKey, *,
+                         cache: BlockCipherCache = None) -> BlockArray:
+    """
+    Encrypt binary data. `data` is read through a `memoryview`, so it is not copied.
+    """
+    with asByteView(data) as view:
+        return encryptGoldbachIntShift(view, public_key.a_inv, public_key.b_inv, public_key.k,
+                                       public_key.less_than_n_bit, cache=cache)
+
+
+def encryptGoldbachIntShift(message: bytes | memoryview, a_inv: int, b_inv: int, k: int, less_than_n_bit: int, *,
+                            cache: BlockCipherCache = None) -> BlockArray:
+    # Since we add one more bit before the extract bit, so block has `less_than_n_bit - 1` bits
+    packer = BlockPacker(less_than_n_bit - 1)
+
+    return BlockArray.fromBlocks(encryptBlocks(packer.feed(message) + packer.finish(), a_inv, b_inv, k, cache=cache),
+                                 getBlockWidth(k))
+
+
+def encryptForMany(message: str | bytes | bytearray | memoryview | mmap.mmap,
+                   public_keys: Mapping[Hashable, PublicKey], *,
+                   encoding: str = "utf-8") -> dict[Hashable, GoldbachEncMessage]:
+    """
+    Encrypt the same message for every recipient in `public_keys`, each result same as `encryptGoldbach`.
+    The message is cut into blocks only once for each `less_than_n_bit`, then only the multiply is
+    done for each key (and only once for recipients sharing the same key, whose messages share the blocks).
+    """
+    if not isinstance(message, BYTES_LIKE):
+        message = str(message).encode(encoding)
+
+    # less_than_n_bit -> k -> recipients with that key
+    groups: dict[int, dict[int, list[Hashable]]] = dict()
+    keys_by_k: dict[int, PublicKey] = dict()
+    for recipient, public_key in public_keys.items():
+        groups.setdefault(public_key.less_than_n_bit, dict()).setdefault(public_key.k, []).append(recipient)
+        keys_by_k[public_key.k] = public_key
+
+    result = dict()
+    with asByteView(message) as view:
+        for less_than_n_bit, recipients_by_k in groups.items():
+            packer = BlockPacker(less_than_n_bit - 1)
+            blocks = packer.feed(view) + packer.finish()
+
+            for k, recipients in recipients_by_k.items():
+                public_key = keys_by_k[k]
+                encrypted = BlockArray.fromBlocks(encryptBlocks(blocks, public_key.a_inv, public_key.b_inv, k),
+                                                  getBlockWidth(k))
+                # Recipients of the same key share the blocks (do not change them in place),
+                #  but each has its own message, so setting like `compression` of one does not touch others
+                for recipient in recipients:
+                    result[recipient] = GoldbachEncMessage(encrypted, k)
+
+    return result
+
+
+def encryptBlocks(blocks: list[int], a_inv: int, b_inv: int, k: int, *,
+                  start_at: int = 0,
+                  cache: BlockCipherCache = None) -> list[int]:
+    """
+    Encrypt blocks which already have the leading one.
+
+    `start_at` is the index of the first block in the whole message,
+    it decides whether the block uses `a_inv` or `b_inv`.
+    """
+    multipliers = (a_inv, b_inv) if start_at % 2 == 0 else (b_inv, a_inv)
+    encrypt_result = [0] * len(blocks)
+
+    # Every block is at least 1, so if both multipliers are not less than `k`, the check below never fails
+    if cache is None and min(a_inv, b_inv) >= k:
+        with instrument.stage("encrypt.multiply_mod") as stage:
+            even, odd = multipliers
+            encrypt_result[0::2] = arithmetic.mulModList(blocks[0::2], even, k)
+            encrypt_result[1::2] = arithmetic.mulModList(blocks[1::2], odd, k)
+            stage.addWork(n_block=len(blocks))
+
+        return encrypt_result
+
+    with instrument.stage("encrypt.multiply_mod") as stage:
+        for i, number_from_bits in enumerate(blocks):
+            if cache is not None:
+                parity = (start_at + i) & 1
+                if (cached := cache.get(BlockCipherCache.encrypt, parity, number_from_bits)) is not None:
+                    encrypt_result[i] = cached
+                    continue
+
+            number_multiplied = number_from_bits * multipliers[i & 1]
+
+            # Checkpoint: If failed, it implies the a_inv or b_inv is still too small
+            if number_multiplied < k:
+                raise ArithmeticError(
+                    f"{'a_inv' if (start_at + i) % 2 == 0 else 'b_inv'} is too small ({multipliers[i & 1]})! "
+                    + f"Should be greater than k ({k}), multiply result is {number_multiplied}"
+                )
+
+            encrypt_result[i] = number_multiplied % k
+            if cache is not None:
+                cache.put(BlockCipherCache.encrypt, parity, number_from_bits, encrypt_result[i])
+
+        stage.addWork(n_block=len(blocks))
+
     return encrypt_result
 
 
-def decryptGoldbach(message: deque[int], private_key: PrivateKey, *, encoding: str = "utf-8") -> str:
+def readChunks(source: BinaryIO | Iterable[bytes], chunk_size: int) -> Iterator[bytes]:
+    """
+    Read from a binary file object, or just go through an iterator of bytes.
+    """
+    if hasattr(source, "read"):
+        while len(chunk := source.read(chunk_size)) > 0:
+            yield chunk
+    else:
+        yield from source
+
+
+def encryptGoldbachStream(source: BinaryIO | Iterable[bytes], public_key: PublicKey, *,
+                          chunk_size: int = 1 << 16) -> Iterator[int]:
+    """
+    Encrypt bytes from `source` chunk by chunk, and give out the encrypted blocks one by one.
+    Only one chunk is held in memory at a time.
+
+    The result is same as `encryptGoldbach` with the bytes of the whole `source`.
+    """
+    a_inv = public_key.a_inv
+    b_inv = public_key.b_inv
+    k = public_key.k
+    packer = BlockPacker(public_key.less_than_n_bit - 1)
+
+    # Index of next block in whole message, to keep the a/b order across chunks
+    i = 0
+    for chunk in readChunks(source, chunk_size):
+        blocks = packer.feed(chunk)
+        yield from encryptBlocks(blocks, a_inv, b_inv, k, start_at=i)
+        i += len(blocks)
+
+    yield from encryptBlocks(packer.finish(), a_inv, b_inv, k, start_at=i)
+
+
+def decryptGoldbach(message: Iterable[int], private_key: PrivateKey, *,
+                    encoding: str = "utf-8",
+                    engine: BlockEngine = BlockEngine.int_shift,
+                    cache: BlockCipherCache = None) -> str | bytes:
+    # `cache` is only used by `BlockEngine.int_shift`.
+    # Give `encoding=None` to get the raw bytes (see `decryptGoldbachBytes`).
     a = private_key.a
     b = private_key.b
     n = private_key.n
     i = 0
 
+    if encoding is None:
+        return decryptGoldbachBytes(message, private_key, cache=cache)
+
+    if engine == BlockEngine.int_shift:
+        return decryptGoldbachIntShift(message, a, b, n, encoding=encoding, cache=cache)
+
+    # NOTICE: this way pops all numbers out of `message` (if it is a deque)
+    if not isinstance(message, deque):
+        message = deque(message)
+
     extracter = StringMakerFromBytes(encoding=encoding)
 
     # In order to avoid the resize of the deque.
@@ -165,8 +840,230 @@ def decryptGoldbach(message: deque[int], private_key: PrivateKey, *, encoding: s
 
         # Try to decode and extract
         extracter.decode()
-        decrypt_result.write(extracter.extract())
+        with instrument.stage("decrypt.string_buffer_write"):
+            decrypt_result.write(extracter.extract())
 
         i += 1
 
     return decrypt_result.getvalue()
+
+
+def decryptGoldbachBytes(message: Iterable[int], private_key: PrivateKey, *,
+                         n_block_per_batch: int = 4096,
+                         cache: BlockCipherCache = None) -> bytes:
+    """
+    Decrypt to the raw bytes, without decoding them as text.
+    """
+    return b"".join(decryptBlocksToBytes(message, private_key.a, private_key.b, private_key.n,
+                                         n_block_per_batch=n_block_per_batch, cache=cache))
+
+
+def decryptGoldbachIntShift(message: Iterable[int], a: int, b: int, n: int, *,
+                            encoding: str = "utf-8",
+                            n_block_per_batch: int = 4096,
+                            cache: BlockCipherCache = None) -> str:
+    decoder = getincrementaldecoder(encoding)()
+    decrypt_result = []
+    for x in decryptBlocksToBytes(message, a, b, n, n_block_per_batch=n_block_per_batch, cache=cache):
+        with instrument.stage("decrypt.decode") as stage:
+            decrypt_result.append(decoder.decode(x))
+            stage.addWork(n_byte=len(x))
+
+    # Bits less than one byte are the trailing zero, they are already dropped
+    decrypt_result.append(decoder.decode(b"", final=True))
+
+    return "".join(decrypt_result)
+
+
+def decryptBlocksToBytes(message: Iterable[int], a: int, b: int, n: int, *,
+                         n_block_per_batch: int = 4096,
+                         cache: BlockCipherCache = None) -> Iterator[bytearray]:
+    """
+    Decrypt `n_block_per_batch` blocks at a time, and give out the bytes of them.
+    Only iterate the message, so the caller's deque is not consumed.
+    """
+    unpacker = BlockUnpacker()
+    message_iter = iter(message)
+
+    # Index of the first block of the batch
+    i = 0
+    while True:
+        if isinstance(message, BlockArray):
+            batch = message.toList(i, i + n_block_per_batch)
+        else:
+            batch = list(islice(message_iter, n_block_per_batch))
+
+        with instrument.stage("decrypt.multiply_mod") as stage:
+            even, odd = (a, b) if i % 2 == 0 else (b, a)
+            plain_blocks = [0] * len(batch)
+
+            if cache is None:
+                # Same as `x % n * a % n`, since `(x % n) * a` and `x * a` are same under mod n
+                plain_blocks[0::2] = arithmetic.mulModList(batch[0::2], even, n)
+                plain_blocks[1::2] = arithmetic.mulModList(batch[1::2], odd, n)
+            else:
+                for j, x in enumerate(batch):
+                    parity = (i + j) & 1
+                    if (plain := cache.get(BlockCipherCache.decrypt, parity, x)) is None:
+                        plain = cache.put(BlockCipherCache.decrypt, parity, x, x * (odd if j & 1 else even) % n)
+                    plain_blocks[j] = plain
+
+            stage.addWork(n_block=len(batch))
+
+        yield unpacker.feed(plain_blocks)
+        i += len(batch)
+
+        if len(batch) < n_block_per_batch:
+            break
+
+
+def decryptGoldbachStream(source: Iterable[int], private_key: PrivateKey, *,
+                          encoding: str = None,
+                          n_block_per_batch: int = 4096) -> Iterator[bytes | str]:
+    """
+    Decrypt blocks from `source` (like the result of `encryptGoldbachStream`),
+    and give out the plaintext batch by batch.
+
+    Gives `bytes` by default, or `str` if `encoding` is specified
+    (a character split between two batches is given out with the later batch).
+    """
+    batches = decryptBlocksToBytes(source, private_key.a, private_key.b, private_key.n,
+                                   n_block_per_batch=n_block_per_batch)
+
+    if encoding is None:
+        for x in batches:
+            if len(x) > 0:
+                yield bytes(x)
+        return
+
+    decoder = getincrementaldecoder(encoding)()
+    for x in batches:
+        if len(s := decoder.decode(x)) > 0:
+            yield s
+
+    if len(s := decoder.decode(b"", final=True)) > 0:
+        yield s
+
+
+def groupMessages(offsets: Sequence[int], n_block_per_batch: int) -> Iterator[tuple[int, int]]:
+    """
+    Cut messages into groups of at most `n_block_per_batch` blocks (a bigger message is a group itself),
+    gives the first message and the end (not included) of each group.
+    """
+    i = 0
+    n_message = len(offsets) - 1
+    while i < n_message:
+        j = max(i + 1, bisect_right(offsets, offsets[i] + n_block_per_batch, i) - 1)
+        yield i, j
+        i = j
+
+
+def mulModByParity(blocks: list[int], offsets: Sequence[int], even: int, odd: int, mod: int) -> list[int]:
+    """
+    Multiply blocks at even position inside their own message by `even` (since each message starts with `a`),
+    and the others by `odd`. `offsets` are where each message of `blocks` starts, and the end.
+    """
+    even_blocks, odd_blocks = [], []
+    for start, stop in zip(offsets, offsets[1:]):
+        even_blocks += blocks[start:stop:2]
+        odd_blocks += blocks[start + 1:stop:2]
+
+    even_blocks = arithmetic.mulModList(even_blocks, even, mod)
+    odd_blocks = arithmetic.mulModList(odd_blocks, odd, mod)
+
+    # Put them back in place
+    i_even = i_odd = 0
+    for start, stop in zip(offsets, offsets[1:]):
+        n_even, n_odd = (stop - start + 1) // 2, (stop - start) // 2
+        blocks[start:stop:2] = even_blocks[i_even:i_even + n_even]
+        blocks[start + 1:stop:2] = odd_blocks[i_odd:i_odd + n_odd]
+        i_even += n_even
+        i_odd += n_odd
+
+    return blocks
+
+
+def encryptGoldbachBatch(messages: Sequence[str | bytes | bytearray | memoryview | mmap.mmap], public_key: PublicKey, *,
+                         encoding: str = "utf-8",
+                         n_block_per_batch: int = 4096,
+                         executor: Executor = None,
+                         n_message_per_task: int = 4096) -> GoldbachEncBatch:
+    """
+    Encrypt many (small) messages with one key, message `i` of the result is same as `encryptGoldbach`
+    of `messages[i]`. Blocks of about `n_block_per_batch` from several messages are multiplied together,
+    and everything is saved into one buffer.
+
+    If `executor` is given, every `n_message_per_task` messages are encrypted as a task in it.
+    """
+    if executor is not None and len(messages) > n_message_per_task:
+        futures = [executor.submit(encryptGoldbachBatch, messages[i:i + n_message_per_task], public_key,
+                                   encoding=encoding, n_block_per_batch=n_block_per_batch)
+                   for i in range(0, len(messages), n_message_per_task)]
+        return GoldbachEncBatch.concat([x.result() for x in futures])
+
+    a_inv, b_inv, k = public_key.a_inv, public_key.b_inv, public_key.k
+    blocks, offsets = BlockPacker(public_key.less_than_n_bit - 1).feedEach(
+        x if isinstance(x, BYTES_LIKE) else str(x).encode(encoding) for x in messages)
+    encrypted = BlockArray(getBlockWidth(k))
+
+    if min(a_inv, b_inv) < k:
+        # Each block needs the check, do it message by message
+        for start, stop in zip(offsets, offsets[1:]):
+            encrypted.extend(encryptBlocks(blocks[start:stop], a_inv, b_inv, k))
+    else:
+        for first, end in groupMessages(offsets, n_block_per_batch):
+            base = offsets[first]
+            with instrument.stage("encrypt.multiply_mod") as stage:
+                group = mulModByParity(blocks[base:offsets[end]], [x - base for x in offsets[first:end + 1]],
+                                       a_inv, b_inv, k)
+                stage.addWork(n_block=len(group))
+            encrypted.extend(group)
+
+    return GoldbachEncBatch(encrypted, array("Q", offsets), k)
+
+
+def decryptGoldbachBatch(batch: GoldbachEncBatch, private_key: PrivateKey, *,
+                         encoding: str = "utf-8",
+                         n_block_per_batch: int = 4096,
+                         executor: Executor = None,
+                         n_message_per_task: int = 4096) -> list[str | bytes]:
+    """
+    Decrypt every message of `batch`, gives `bytes` of each if `encoding` is `None`.
+    `n_block_per_batch` and `executor` are used same as `encryptGoldbachBatch`.
+    """
+    if executor is not None and len(batch) > n_message_per_task:
+        futures = [executor.submit(decryptGoldbachBatch, batch[i:i + n_message_per_task], private_key,
+                                   encoding=encoding, n_block_per_batch=n_block_per_batch)
+                   for i in range(0, len(batch), n_message_per_task)]
+        return [x for future in futures for x in future.result()]
+
+    a, b, n = private_key.a, private_key.b, private_key.n
+    offsets = batch.offsets
+    # Blocks of `BlockPacker` have no padding, so payload bits of a message are exactly its bytes,
+    #  and every message can be unpacked by one unpacker. Only the last block of a message is shorter.
+    unpacker = BlockUnpacker()
+    plain = bytearray()
+    message_n_bytes = []
+    for first, end in groupMessages(offsets, n_block_per_batch):
+        base = offsets[first]
+        group_offsets = [x - base for x in offsets[first:end + 1]]
+        with instrument.stage("decrypt.multiply_mod") as stage:
+            # Same as `x % n * a % n`, since `(x % n) * a` and `x * a` are same under mod n
+            plain_blocks = mulModByParity(batch.blocks.toList(base, offsets[end]), group_offsets, a, b, n)
+            stage.addWork(n_block=len(plain_blocks))
+
+        for start, stop in zip(group_offsets, group_offsets[1:]):
+            message_n_bytes.append(0 if start == stop else
+                                   ((stop - start - 1) * (plain_blocks[start].bit_length() - 1)
+                                    + plain_blocks[stop - 1].bit_length() - 1) >> 3)
+        plain += unpacker.feed(plain_blocks)
+
+    result = []
+    byte_start = 0
+    with memoryview(plain) as view:
+        for n_byte in message_n_bytes:
+            message = view[byte_start:byte_start + n_byte]
+            result.append(bytes(message) if encoding is None else str(message, encoding))
+            byte_start += n_byte
+
+    return result
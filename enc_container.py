@@ -0,0 +1,363 @@
+from cryptfunc import BlockArray, PrivateKey, PublicKey, GoldbachEncMessage, encryptBlocks, getBlockWidth, readChunks
+from str_manip import BlockPacker, BlockUnpacker
+
+from collections.abc import Iterable, Iterator
+from typing import BinaryIO
+
+import arithmetic
+import json
+import mmap
+import os
+import struct
+
+
+# Layout of the container file (all numbers are little-endian):
+#
+# * Header: magic `GBEC`, version, block width in byte, `less_than_n_bit`,
+#   byte length of `k`, then `k` itself.
+# * Payload: every encrypted block, each takes exact "block width" bytes
+#   (which is the byte length of `k`, since every block is less than `k`).
+# * Footer: plaintext length, number of blocks, then magic `GBEF`.
+#
+# Every block but the last carries exact `less_than_n_bit - 1` plaintext bits,
+#  so the block of any plaintext offset is computed, and there is no index.
+# Footer is at the end of the file, so the writer does not need to seek back,
+#  and can write to a pipe.
+
+HEADER = struct.Struct("<4sBIII")
+FOOTER = struct.Struct("<QQ4s")
+HEADER_MAGIC = b"GBEC"
+FOOTER_MAGIC = b"GBEF"
+VERSION = 1
+
+# Progress of `encryptFileResumable` and `decryptFileResumable` is saved next to the output with this suffix
+CHECKPOINT_SUFFIX = ".ckpt"
+# Plaintext bytes done between two checkpoints by default
+CHECKPOINT_INTERVAL = 1 << 26
+
+
+class EncContainerWriter:
+    """
+    Encrypt bytes written to it, and save them in the container format to `fp`.
+    Call `close` (or use `with`) to write the footer.
+
+    With `state` (from `getState`), continue a container written up to that state instead of starting one:
+    the header is not written again, and `fp` should be at `getState()["n_byte"]` of the file.
+    """
+
+    def __init__(self, fp: BinaryIO, public_key: PublicKey, *, state: dict = None) -> None:
+        self.fp = fp
+        self.public_key = public_key
+        self.block_width = getBlockWidth(public_key.k)
+        self.packer = BlockPacker(public_key.less_than_n_bit - 1)
+        self.n_block = 0
+        self.n_plain_byte = 0
+        self.closed = False
+
+        k_bytes = public_key.k.to_bytes(self.block_width, "little")
+        self.payload_offset = HEADER.size + len(k_bytes)
+        if state is not None:
+            self.setState(state)
+            return
+
+        fp.write(HEADER.pack(HEADER_MAGIC, VERSION, self.block_width,
+                             public_key.less_than_n_bit, len(k_bytes)))
+        fp.write(k_bytes)
+
+    def getState(self) -> dict:
+        """
+        Everything needed to continue this container, in plain types (can be saved as JSON).
+        `n_byte` is how long the file is now, and `n_plain_byte` how many input bytes are taken.
+        """
+        return {"k": self.public_key.k, "n_block": self.n_block, "n_plain_byte": self.n_plain_byte,
+                "n_byte": self.payload_offset + self.n_block * self.block_width,
+                "packer": self.packer.getState()}
+
+    def setState(self, state: dict) -> None:
+        # Checkpoint: blocks of another key can not be mixed in one container
+        if state["k"] != self.public_key.k:
+            raise ValueError("The state is of a container with another key.")
+
+        self.packer.setState(state["packer"])
+        self.n_block = state["n_block"]
+        self.n_plain_byte = state["n_plain_byte"]
+
+    def write(self, data: bytes | bytearray | memoryview) -> int:
+        self.writeBlocks(self.packer.feed(data))
+        self.n_plain_byte += len(data)
+        return len(data)
+
+    def writeBlocks(self, blocks: list[int]) -> None:
+        public_key = self.public_key
+        width = self.block_width
+        encrypted = encryptBlocks(blocks, public_key.a_inv, public_key.b_inv, public_key.k,
+                                  start_at=self.n_block)
+        self.fp.write(b"".join([x.to_bytes(width, "little") for x in encrypted]))
+        self.n_block += len(blocks)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        self.writeBlocks(self.packer.finish())
+        self.fp.write(FOOTER.pack(self.n_plain_byte, self.n_block, FOOTER_MAGIC))
+        self.closed = True
+
+    def __enter__(self) -> "EncContainerWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def encryptToContainer(source: BinaryIO | Iterable[bytes], path: str, public_key: PublicKey, *,
+                       chunk_size: int = 1 << 16) -> None:
+    with open(path, "wb") as fp, EncContainerWriter(fp, public_key) as writer:
+        for chunk in readChunks(source, chunk_size):
+            writer.write(chunk)
+
+
+def readContainerK(path: str) -> int:
+    """
+    `k` of the key that encrypted the container, to find its private key before opening it.
+    """
+    with open(path, "rb") as fp:
+        header = fp.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"\"{path}\" is not a GoldbachEnc container (version {VERSION}).")
+
+        magic, version, _, _, len_k = HEADER.unpack(header)
+        if magic != HEADER_MAGIC or version != VERSION:
+            raise ValueError(f"\"{path}\" is not a GoldbachEnc container (version {VERSION}).")
+
+        return int.from_bytes(fp.read(len_k), "little")
+
+
+class EncContainerReader:
+    """
+    Memory-map a container file, and decrypt only the blocks that are needed.
+    """
+
+    def __init__(self, path: str, private_key: PrivateKey) -> None:
+        self.private_key = private_key
+        with open(path, "rb") as fp:
+            self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.block_width, self.less_than_n_bit, len_k = \
+            HEADER.unpack_from(self.mm, 0)
+        if magic != HEADER_MAGIC or version != VERSION:
+            raise ValueError(f"\"{path}\" is not a GoldbachEnc container (version {VERSION}).")
+
+        self.k = int.from_bytes(self.mm[HEADER.size:HEADER.size + len_k], "little")
+        self.payload_offset = HEADER.size + len_k
+
+        self.n_plain_byte, self.n_block, magic = \
+            FOOTER.unpack_from(self.mm, len(self.mm) - FOOTER.size)
+        if magic != FOOTER_MAGIC:
+            raise ValueError(f"Container \"{path}\" is truncated (footer not found).")
+
+        # Checkpoint: `k` is `n` multiplied by other primes
+        if self.k % private_key.n != 0:
+            raise KeyError(f"The private key does not belong to the key k = {self.k} of this container.")
+
+        self.n_bit = self.less_than_n_bit - 1
+
+    def __len__(self) -> int:
+        return self.n_plain_byte
+
+    def getBlock(self, i: int) -> int:
+        start = self.payload_offset + i * self.block_width
+        return int.from_bytes(self.mm[start:start + self.block_width], "little")
+
+    def iterBlocks(self, start: int = 0, stop: int = None) -> Iterator[int]:
+        stop = self.n_block if stop is None else min(stop, self.n_block)
+        for i in range(start, stop):
+            yield self.getBlock(i)
+
+    def findBlock(self, offset: int) -> int:
+        """
+        Number of the block holding the first bit of plaintext byte `offset`.
+        """
+        # Every block before it carries exact `n_bit` bits
+        return offset * 8 // self.n_bit
+
+    def read(self, start: int = 0, stop: int = None) -> bytes:
+        """
+        Decrypt plaintext bytes in range `[start, stop)`.
+        """
+        stop = self.n_plain_byte if stop is None else min(stop, self.n_plain_byte)
+        if start >= stop:
+            return b""
+
+        a, b, n = self.private_key.a, self.private_key.b, self.private_key.n
+        n_bit = self.n_bit
+        first_block = self.findBlock(start)
+        last_block = ((stop * 8 - 1) // n_bit)
+
+        # Same batch decrypt as `decryptBlocksToBytes`, payload is already in the layout of `BlockArray`
+        width = self.block_width
+        payload_start = self.payload_offset + first_block * width
+        encrypted = BlockArray(width, self.mm[payload_start:payload_start + (last_block + 1 - first_block) * width])
+        blocks = encrypted.toList()
+        even, odd = (a, b) if first_block % 2 == 0 else (b, a)
+        blocks[0::2] = arithmetic.mulModList(blocks[0::2], even, n)
+        blocks[1::2] = arithmetic.mulModList(blocks[1::2], odd, n)
+
+        # Cut bits before `start` off the first block, but keep the leading one
+        skip_n_bit = start * 8 - first_block * n_bit
+        first_n_bit = blocks[0].bit_length() - 1 - skip_n_bit
+        blocks[0] = (1 << first_n_bit) | (blocks[0] & ((1 << first_n_bit) - 1))
+
+        return bytes(BlockUnpacker().feed(blocks)[:stop - start])
+
+    def toEncMessage(self) -> GoldbachEncMessage:
+        # Payload is already in the layout of `BlockArray`, just copy the bytes
+        payload_end = self.payload_offset + self.n_block * self.block_width
+        return GoldbachEncMessage(BlockArray(self.block_width, self.mm[self.payload_offset:payload_end]), self.k)
+
+    def close(self) -> None:
+        self.mm.close()
+
+    def __enter__(self) -> "EncContainerReader":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def saveCheckpoint(path: str, checkpoint: dict) -> None:
+    """
+    Replace the checkpoint file at once, so a crash leaves either the old checkpoint or the new one.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as fp:
+        json.dump(checkpoint, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(temp_path, path)
+
+
+def loadCheckpoint(path: str, kind: str, source: str) -> dict | None:
+    """
+    Checkpoint saved by the same kind of job on the same `source`, or `None` if there is no checkpoint.
+    """
+    try:
+        with open(path) as fp:
+            checkpoint = json.load(fp)
+    except FileNotFoundError:
+        return None
+
+    if checkpoint.get("version") != VERSION or checkpoint.get("kind") != kind:
+        raise ValueError(f"\"{path}\" is not a checkpoint of GoldbachEnc {kind} (version {VERSION}).")
+    # Checkpoint: resuming on a changed source would give a mixed result
+    if checkpoint["source"] != getFileId(source):
+        raise ValueError(f"\"{source}\" has changed since the checkpoint \"{path}\", remove it to start over.")
+
+    return checkpoint
+
+
+def getFileId(path: str) -> dict[str, int]:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def openForResume(path: str, n_byte: int) -> BinaryIO:
+    """
+    Open the output of a job to continue at `n_byte`, what is written after the checkpoint is dropped.
+    """
+    fp = open(path, "r+b")
+    if fp.seek(0, os.SEEK_END) < n_byte:
+        fp.close()
+        raise ValueError(f"\"{path}\" is shorter than its checkpoint ({n_byte} B), "
+                         f"remove the checkpoint to start over.")
+
+    fp.truncate(n_byte)
+    fp.seek(n_byte)
+    return fp
+
+
+def syncFile(fp: BinaryIO) -> None:
+    # Output must be on the disk before the checkpoint says it is
+    fp.flush()
+    os.fsync(fp.fileno())
+
+
+def encryptFileResumable(source: str, target: str, public_key: PublicKey, *,
+                         checkpoint_path: str = None,
+                         checkpoint_interval: int = CHECKPOINT_INTERVAL,
+                         chunk_size: int = 1 << 20) -> int:
+    """
+    Encrypt file `source` into container file `target`, and save the progress to `checkpoint_path`
+    (`target` + ".ckpt" by default) about every `checkpoint_interval` plaintext bytes.
+
+    If the checkpoint is there, continue from it, the result is same as a run that never stopped.
+    The checkpoint is removed when done. Returns the plaintext length.
+    """
+    checkpoint_path = target + CHECKPOINT_SUFFIX if checkpoint_path is None else checkpoint_path
+    checkpoint = loadCheckpoint(checkpoint_path, "encrypt", source)
+
+    with open(source, "rb") as fp_in:
+        if checkpoint is None:
+            fp_out = open(target, "wb")
+            writer = EncContainerWriter(fp_out, public_key)
+        else:
+            state = checkpoint["writer"]
+            fp_out = openForResume(target, state["n_byte"])
+            writer = EncContainerWriter(fp_out, public_key, state=state)
+            fp_in.seek(writer.n_plain_byte)
+
+        with fp_out:
+            n_plain_byte_saved = writer.n_plain_byte
+            for chunk in readChunks(fp_in, chunk_size):
+                writer.write(chunk)
+
+                if writer.n_plain_byte - n_plain_byte_saved >= checkpoint_interval:
+                    syncFile(fp_out)
+                    saveCheckpoint(checkpoint_path, {"version": VERSION, "kind": "encrypt",
+                                                     "source": getFileId(source), "writer": writer.getState()})
+                    n_plain_byte_saved = writer.n_plain_byte
+
+            writer.close()
+            syncFile(fp_out)
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return writer.n_plain_byte
+
+
+def decryptFileResumable(source: str, target: str, private_key: PrivateKey, *,
+                         checkpoint_path: str = None,
+                         checkpoint_interval: int = CHECKPOINT_INTERVAL,
+                         chunk_size: int = 1 << 20) -> int:
+    """
+    Decrypt container file `source` into `target`, saving the progress like `encryptFileResumable`.
+    The container is read at any offset, so the checkpoint only needs how many bytes are written.
+    """
+    checkpoint_path = target + CHECKPOINT_SUFFIX if checkpoint_path is None else checkpoint_path
+    checkpoint = loadCheckpoint(checkpoint_path, "decrypt", source)
+
+    with EncContainerReader(source, private_key) as reader:
+        if checkpoint is None:
+            n_done = 0
+            fp_out = open(target, "wb")
+        else:
+            n_done = checkpoint["n_plain_byte"]
+            fp_out = openForResume(target, n_done)
+
+        with fp_out:
+            n_done_saved = n_done
+            while n_done < len(reader):
+                fp_out.write(reader.read(n_done, n_done + chunk_size))
+                n_done = min(n_done + chunk_size, len(reader))
+
+                if n_done - n_done_saved >= checkpoint_interval:
+                    syncFile(fp_out)
+                    saveCheckpoint(checkpoint_path, {"version": VERSION, "kind": "decrypt",
+                                                     "source": getFileId(source), "n_plain_byte": n_done})
+                    n_done_saved = n_done
+
+            syncFile(fp_out)
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return n_done
@@ -0,0 +1,338 @@
+from cryptfunc import BlockWidth, PrivateKey, PublicKey, generateKeyGoldbach, getKeyStats, readChunks
+from enc_container import (EncContainerReader, EncContainerWriter, decryptFileResumable, encryptFileResumable,
+                           readContainerK)
+from key_directory import MappedPublicKeyDirectory, PublicKeyDirectory
+from keyring import Keyring
+
+from argparse import ArgumentParser, Namespace
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from functools import partial
+from random import Random
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from time import perf_counter
+from typing import BinaryIO
+
+import os
+import shutil
+import sys
+
+
+# Encrypted files are saved in the format of `enc_container.py`, with this suffix
+CONTAINER_SUFFIX = ".gbec"
+# Plaintext bytes read (or decrypted) at a time, so big files are never loaded at once
+CHUNK_SIZE = 1 << 20
+# "-" as input or output means stdin or stdout
+STDIO = "-"
+
+
+def openInput(path: str) -> BinaryIO | nullcontext:
+    # Do not close stdin, so return it without the `with` effect
+    return nullcontext(sys.stdin.buffer) if path == STDIO else open(path, "rb")
+
+
+def openOutput(path: str) -> BinaryIO | nullcontext:
+    if path == STDIO:
+        return nullcontext(sys.stdout.buffer)
+
+    directory = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+    return open(path, "wb")
+
+
+def makeReport(source: str, n_byte: int, seconds: float) -> dict:
+    return {"path": source, "n_byte": n_byte, "seconds": seconds,
+            "throughput_mb_per_second": n_byte / 1e6 / seconds if seconds > 0 else 0.0}
+
+
+def encryptFile(source: str, target: str, public_key: PublicKey, *, chunk_size: int = CHUNK_SIZE,
+                checkpoint_interval: int = None) -> dict:
+    """
+    Encrypt file `source` into container file `target`, a chunk at a time.
+    With `checkpoint_interval`, save the progress next to `target` and resume from it (files only).
+    """
+    start = perf_counter()
+    if checkpoint_interval is not None:
+        n_byte = encryptFileResumable(source, target, public_key,
+                                      checkpoint_interval=checkpoint_interval, chunk_size=chunk_size)
+        return makeReport(source, n_byte, perf_counter() - start)
+
+    with openInput(source) as fp_in, openOutput(target) as fp_out:
+        with EncContainerWriter(fp_out, public_key) as writer:
+            for chunk in readChunks(fp_in, chunk_size):
+                writer.write(chunk)
+        fp_out.flush()
+
+    return makeReport(source, writer.n_plain_byte, perf_counter() - start)
+
+
+def decryptFile(source: str, target: str, private_key: PrivateKey, *, chunk_size: int = CHUNK_SIZE,
+                checkpoint_interval: int = None) -> dict:
+    """
+    Decrypt container file `source` into `target`, a chunk at a time.
+    `source` should be a real file (not stdin), since the container is memory-mapped.
+    """
+    start = perf_counter()
+    if checkpoint_interval is not None:
+        n_byte = decryptFileResumable(source, target, private_key,
+                                      checkpoint_interval=checkpoint_interval, chunk_size=chunk_size)
+        return makeReport(source, n_byte, perf_counter() - start)
+
+    with EncContainerReader(source, private_key) as reader, openOutput(target) as fp_out:
+        for offset in range(0, len(reader), chunk_size):
+            fp_out.write(reader.read(offset, offset + chunk_size))
+        fp_out.flush()
+        n_byte = len(reader)
+
+    return makeReport(source, n_byte, perf_counter() - start)
+
+
+def listJobs(inputs: list[str], output: str | None, rename: Callable[[str], str]) -> list[tuple[str, str]]:
+    """
+    (source, target) of every file to handle. Directories are walked, and the tree is kept under `output`.
+    Without `output`, the target is next to the source, named by `rename`.
+    """
+    if inputs == [STDIO]:
+        return [(STDIO, STDIO if output is None else output)]
+
+    # Path, and its name relative to the input
+    sources = []
+    for x in inputs:
+        if os.path.isdir(x):
+            for root, dir_names, file_names in os.walk(x):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    path = os.path.join(root, file_name)
+                    sources.append((path, os.path.relpath(path, x)))
+        elif os.path.isfile(x):
+            sources.append((x, os.path.basename(x)))
+        else:
+            raise FileNotFoundError(f"Input \"{x}\" does not exist.")
+
+    if output is None:
+        return [(path, rename(path)) for path, _ in sources]
+
+    # One file to one file
+    if len(inputs) == 1 and not os.path.isdir(inputs[0]) and not os.path.isdir(output):
+        return [(inputs[0], output)]
+
+    return [(path, os.path.join(output, rename(name))) for path, name in sources]
+
+
+def addSuffix(path: str) -> str:
+    return path + CONTAINER_SUFFIX
+
+
+def removeSuffix(path: str) -> str:
+    return path[:-len(CONTAINER_SUFFIX)] if path.endswith(CONTAINER_SUFFIX) else path + ".dec"
+
+
+def runJobs(func: Callable[..., dict], jobs: list[tuple], *, n_job: int = 1) -> Iterator[dict]:
+    """
+    Call `func(*job)` for every job, in `n_job` processes. Reports are given when each job finishes.
+    """
+    if n_job <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield func(*job)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(n_job, len(jobs))) as executor:
+        futures = [executor.submit(func, *job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def printReports(reports: Iterator[dict]) -> list[dict]:
+    """
+    One line for each file as soon as it is done, then the total. Printed to stderr, stdout may be the data.
+    """
+    start = perf_counter()
+    result = []
+    for report in reports:
+        result.append(report)
+        print(f"{report['path']}: {report['n_byte']} B in {report['seconds'] * 1e3:.3f}ms "
+              f"({report['throughput_mb_per_second']:.3f}MB/s)", file=sys.stderr)
+
+    seconds = perf_counter() - start
+    n_byte = sum(x["n_byte"] for x in result)
+    print(f"{len(result)} files, {n_byte} B in {seconds:.3f}s "
+          f"({n_byte / 1e6 / seconds if seconds > 0 else 0.0:.3f}MB/s)", file=sys.stderr)
+    return result
+
+
+def loadPublicKey(args: Namespace) -> PublicKey:
+    """
+    Public key of `--name`, from `--directory` if given, or else from `--keyring`.
+    """
+    if args.directory is not None:
+        if args.name is None:
+            raise KeyError("--name is needed to find a key in --directory.")
+        with MappedPublicKeyDirectory(args.directory) as directory:
+            public_key = directory.lookup(args.name)
+        if public_key is None:
+            raise KeyError(f"No public key named \"{args.name}\" in \"{args.directory}\".")
+        return public_key
+
+    if args.keyring is None:
+        raise KeyError("Either --keyring or --directory is needed to encrypt.")
+
+    with Keyring(args.keyring) as keyring:
+        if args.name is not None:
+            return keyring.getByName(args.name).public_key
+
+        # Checkpoint: Without name, only a keyring of one key is clear
+        if len(keyring) != 1:
+            raise KeyError(f"Keyring \"{args.keyring}\" has {len(keyring)} keys, choose one by --name.")
+        return keyring[next(iter(keyring))].public_key
+
+
+def publishPublicKey(path: str, name: str, public_key: PublicKey) -> None:
+    """
+    Add (or replace) `name` in the directory file at `path`, which is created if not there.
+    """
+    directory = PublicKeyDirectory()
+    if os.path.exists(path):
+        with MappedPublicKeyDirectory(path) as mapped:
+            for x in mapped.names():
+                directory.publish(x, mapped.lookup(x))
+
+    directory.publish(name, public_key)
+    directory.export(path)
+
+
+def commandKeygen(args: Namespace) -> None:
+    if args.directory is not None and args.name is None:
+        raise KeyError("--name is needed to publish the key to --directory.")
+
+    goldbach_key = generateKeyGoldbach(a_bit=args.a_bit, b_bit=args.b_bit,
+                                       block_width=BlockWidth[args.block_width])
+    with Keyring(args.keyring) as keyring:
+        keyring.add(goldbach_key, name=args.name)
+    if args.directory is not None:
+        publishPublicKey(args.directory, args.name, goldbach_key.public_key)
+
+    stats = getKeyStats(goldbach_key.public_key)
+    print(f"k = {goldbach_key.public_key.k}")
+    print(f"{stats['payload_bit']} bit per block, {stats['block_byte']} B stored, "
+          f"expansion x{stats['expansion_ratio']:.3f}, {stats['blocks_per_kb']} blocks/KB")
+
+
+def commandEncrypt(args: Namespace) -> None:
+    public_key = loadPublicKey(args)
+    jobs = [(source, target, public_key) for source, target in listJobs(args.inputs, args.output, addSuffix)]
+    printReports(runJobs(partial(encryptFile, checkpoint_interval=args.checkpoint), jobs, n_job=args.jobs))
+
+
+def commandDecrypt(args: Namespace) -> None:
+    with Keyring(args.keyring) as keyring, TemporaryDirectory() as temp_dir:
+        jobs = []
+        for source, target in listJobs(args.inputs, args.output, removeSuffix):
+            if source == STDIO:
+                # Container has its footer at the end, and is read by `mmap`, so keep stdin in a file first
+                with NamedTemporaryFile(dir=temp_dir, delete=False) as fp:
+                    shutil.copyfileobj(sys.stdin.buffer, fp)
+                    source = fp.name
+
+            # Find the key by `k` in the header, so files of different keys can be decrypted together
+            k = readContainerK(source)
+            if k not in keyring:
+                raise KeyError(f"No private key of \"{source}\" (k = {k}) in \"{args.keyring}\".")
+            jobs.append((source, target, keyring[k].private_key))
+
+        printReports(runJobs(partial(decryptFile, checkpoint_interval=args.checkpoint), jobs, n_job=args.jobs))
+
+
+def commandBench(args: Namespace) -> None:
+    """
+    Encrypt then decrypt `--files` random files of `--size` bytes, through the same path as the commands.
+    """
+    goldbach_key = generateKeyGoldbach(a_bit=args.a_bit, b_bit=args.b_bit, block_width=BlockWidth[args.block_width])
+    rng = Random(args.seed)
+
+    with TemporaryDirectory() as temp_dir:
+        plain_dir, enc_dir, dec_dir = (os.path.join(temp_dir, x) for x in ("plain", "enc", "dec"))
+        os.makedirs(plain_dir)
+        for i in range(args.files):
+            with open(os.path.join(plain_dir, f"{i}.bin"), "wb") as fp:
+                fp.write(rng.randbytes(args.size))
+
+        print("encrypt:", file=sys.stderr)
+        jobs = [(source, target, goldbach_key.public_key)
+                for source, target in listJobs([plain_dir], enc_dir, addSuffix)]
+        printReports(runJobs(encryptFile, jobs, n_job=args.jobs))
+
+        print("decrypt:", file=sys.stderr)
+        jobs = [(source, target, goldbach_key.private_key)
+                for source, target in listJobs([enc_dir], dec_dir, removeSuffix)]
+        printReports(runJobs(decryptFile, jobs, n_job=args.jobs))
+
+        # Checkpoint: Everything comes back
+        for source, target in listJobs([plain_dir], dec_dir, lambda x: x):
+            with open(source, "rb") as fp_plain, open(target, "rb") as fp_dec:
+                if fp_plain.read() != fp_dec.read():
+                    raise ValueError(f"Decrypted \"{target}\" differs from \"{source}\".")
+
+
+def addKeyOptions(parser: ArgumentParser) -> None:
+    parser.add_argument("--a-bit", type=int, default=16, help="Bit length of the secret prime a.")
+    parser.add_argument("--b-bit", type=int, default=16, help="Bit length of the secret prime b.")
+    parser.add_argument("--block-width", choices=[x.name for x in BlockWidth], default=BlockWidth.maximum.name)
+
+
+def makeParser() -> ArgumentParser:
+    parser = ArgumentParser(prog="goldbachenc", description="Encrypt and decrypt files with GoldbachEnc.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    keygen = commands.add_parser("keygen", help="Generate a key into a keyring.")
+    keygen.add_argument("--keyring", required=True, help="Keyring file, created if not there.")
+    keygen.add_argument("--name", help="Name of the new key.")
+    keygen.add_argument("--directory", help="Also publish the public key to this directory file (needs --name).")
+    addKeyOptions(keygen)
+    keygen.set_defaults(func=commandKeygen)
+
+    for name, func, help_text in (("encrypt", commandEncrypt, "Encrypt files, directories or stdin."),
+                                  ("decrypt", commandDecrypt, "Decrypt containers, directories or stdin.")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("inputs", nargs="+", help=f"Files or directories, \"{STDIO}\" for stdin.")
+        command.add_argument("-o", "--output",
+                             help=f"Output file (or directory for several inputs), \"{STDIO}\" for stdout. "
+                                  f"Next to each input by default.")
+        command.add_argument("--keyring", required=name == "decrypt", help="Keyring file.")
+        command.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes for several files.")
+        command.add_argument("--checkpoint", type=int, metavar="BYTES",
+                             help="Save the progress next to each output (\"<output>.ckpt\") every this many bytes, "
+                                  "and resume from it if there. Files only.")
+        if name == "encrypt":
+            command.add_argument("--name", help="Name of the key, needed if the keyring has several keys.")
+            command.add_argument("--directory", help="Public key directory file to find --name in.")
+        command.set_defaults(func=func)
+
+    bench = commands.add_parser("bench", help="Measure file encrypt/decrypt speed.")
+    bench.add_argument("--files", type=int, default=4)
+    bench.add_argument("--size", type=int, default=1_000_000, help="Bytes of each file.")
+    bench.add_argument("-j", "--jobs", type=int, default=1)
+    bench.add_argument("--seed", type=int, default=0)
+    addKeyOptions(bench)
+    bench.set_defaults(func=commandBench)
+
+    return parser
+
+
+def main(argv: list[str] = None) -> None:
+    parser = makeParser()
+    args = parser.parse_args(argv)
+    if args.command in ("encrypt", "decrypt") and STDIO in args.inputs and args.inputs != [STDIO]:
+        parser.error(f"\"{STDIO}\" can not be used with other inputs.")
+    if getattr(args, "checkpoint", None) is not None and STDIO in (*args.inputs, args.output):
+        parser.error(f"--checkpoint can not be used with \"{STDIO}\".")
+
+    try:
+        args.func(args)
+    except (KeyError, ValueError, OSError) as e:
+        parser.exit(1, f"goldbachenc: error: {e.args[0] if isinstance(e, KeyError) else e}\n")
+
+
+if __name__ == "__main__":
+    main()
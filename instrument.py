@@ -0,0 +1,144 @@
+from threading import Lock
+from time import perf_counter
+
+import tracemalloc
+
+
+# Instrumentation is off by default. When off, `stage` gives a shared object that does nothing,
+#  and `count` returns at once, so the cost is only one function call at each place.
+enabled = False
+trace_memory = False
+
+# Stage name -> [calls, seconds, blocks, bytes, peak memory]
+_stages: dict[str, list] = dict()
+# Event name -> count
+_counters: dict[str, int] = dict()
+_lock = Lock()
+
+
+def enable(*, with_memory: bool = False) -> None:
+    """
+    `with_memory` also records the peak memory of each stage by `tracemalloc`, which is slow.
+    """
+    global enabled, trace_memory
+    enabled = True
+    trace_memory = with_memory
+
+    if with_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable() -> None:
+    global enabled, trace_memory
+    enabled = False
+    trace_memory = False
+
+
+class Stage:
+    """
+    Time a block of code by `with`, and record how many blocks and bytes are done in it.
+    If stages are nested with `with_memory`, the inner stage resets the peak of the outer one.
+    """
+
+    __slots__ = ("name", "n_block", "n_byte", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.n_block = 0
+        self.n_byte = 0
+
+    def addWork(self, *, n_block: int = 0, n_byte: int = 0) -> None:
+        self.n_block += n_block
+        self.n_byte += n_byte
+
+    def __enter__(self) -> "Stage":
+        if trace_memory:
+            tracemalloc.reset_peak()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        seconds = perf_counter() - self.start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+
+        with _lock:
+            record = _stages.get(self.name)
+            if record is None:
+                record = _stages[self.name] = [0, 0.0, 0, 0, 0]
+            record[0] += 1
+            record[1] += seconds
+            record[2] += self.n_block
+            record[3] += self.n_byte
+            record[4] = max(record[4], peak)
+
+
+class NullStage:
+    __slots__ = ()
+
+    def addWork(self, *, n_block: int = 0, n_byte: int = 0) -> None:
+        pass
+
+    def __enter__(self) -> "NullStage":
+        return self
+
+    def __exit__(self, *_) -> None:
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+def stage(name: str) -> Stage | NullStage:
+    return Stage(name) if enabled else NULL_STAGE
+
+
+def count(name: str, n: int = 1) -> None:
+    if not enabled:
+        return
+
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def snapshot() -> dict[str, dict]:
+    with _lock:
+        return {
+            "stages": {
+                name: {"calls": calls, "seconds": seconds, "blocks": n_block, "bytes": n_byte,
+                       "memory_peak_bytes": peak}
+                for name, (calls, seconds, n_block, n_byte, peak) in _stages.items()
+            },
+            "counters": dict(_counters)
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def dumpPrometheus(*, prefix: str = "goldbachenc") -> str:
+    """
+    Text exposition format of Prometheus.
+    """
+    data = snapshot()
+    lines = []
+
+    stage_metrics = [("calls", "stage_calls_total", "counter", "Number of times the stage ran."),
+                     ("seconds", "stage_seconds_total", "counter", "Seconds spent in the stage."),
+                     ("blocks", "stage_blocks_total", "counter", "Blocks handled in the stage."),
+                     ("bytes", "stage_bytes_total", "counter", "Bytes handled in the stage."),
+                     ("memory_peak_bytes", "stage_memory_peak_bytes", "gauge", "Peak traced memory of the stage.")]
+    for field, metric, metric_type, description in stage_metrics:
+        lines.append(f"# HELP {prefix}_{metric} {description}")
+        lines.append(f"# TYPE {prefix}_{metric} {metric_type}")
+        for name, stats in sorted(data["stages"].items()):
+            lines.append(f"{prefix}_{metric}{{stage=\"{name}\"}} {stats[field]}")
+
+    lines.append(f"# HELP {prefix}_events_total Number of times the event happened.")
+    lines.append(f"# TYPE {prefix}_events_total counter")
+    for name, n in sorted(data["counters"].items()):
+        lines.append(f"{prefix}_events_total{{event=\"{name}\"}} {n}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,258 @@
+from cryptfunc import PublicKey
+
+from collections.abc import Iterator, MutableMapping
+
+import mmap
+import struct
+
+
+# Layout of the exported directory file (all numbers are little-endian):
+#
+# * Header: magic `GBPD`, version, number of names, number of keys.
+# * Name table: for each name (sorted by its UTF-8 bytes), offset and byte length of the name,
+#   and offset of its key record. Fixed size, so a name is found by binary search.
+# * Key table: offset of each key record, sorted by `k`.
+# * Names and key records. A key record is `less_than_n_bit`, then `k`, `a_inv`, `b_inv`
+#   each with its byte length.
+#
+# Nothing is parsed at opening, so every worker process can open the same file and share the pages.
+
+FILE_HEADER = struct.Struct("<4sBII")
+NAME_ENTRY = struct.Struct("<QHQ")
+KEY_ENTRY = struct.Struct("<Q")
+FILE_MAGIC = b"GBPD"
+VERSION = 1
+
+
+def getKeyValue(public_key: PublicKey) -> tuple[int, int, int, int]:
+    return public_key.k, public_key.a_inv, public_key.b_inv, public_key.less_than_n_bit
+
+
+def packPublicKeyRecord(public_key: PublicKey) -> bytes:
+    record = [struct.pack("<I", public_key.less_than_n_bit)]
+    for x in (public_key.k, public_key.a_inv, public_key.b_inv):
+        x_bytes = x.to_bytes((x.bit_length() + 7) // 8, "little")
+        record += [struct.pack("<I", len(x_bytes)), x_bytes]
+
+    return b"".join(record)
+
+
+class PublicKeyDirectory:
+    """
+    Public keys published by their owners, shared by every user in the process.
+    Equal keys are interned, so there is only one `PublicKey` object for each of them.
+    """
+
+    def __init__(self) -> None:
+        self.__by_value: dict[tuple[int, int, int, int], PublicKey] = dict()
+        self.__by_name: dict[str, PublicKey] = dict()
+
+    def intern(self, public_key: PublicKey) -> PublicKey:
+        """
+        The shared instance equal to `public_key` (which becomes the shared one if it is new).
+        """
+        return self.__by_value.setdefault(getKeyValue(public_key), public_key)
+
+    def publish(self, name: str, public_key: PublicKey) -> PublicKey:
+        public_key = self.__by_name[name] = self.intern(public_key)
+        return public_key
+
+    def lookup(self, name: str) -> PublicKey | None:
+        return self.__by_name.get(name)
+
+    def names(self) -> Iterator[str]:
+        return iter(self.__by_name)
+
+    def __len__(self) -> int:
+        return len(self.__by_name)
+
+    def export(self, path: str) -> None:
+        """
+        Save the published keys, to be opened by `MappedPublicKeyDirectory`.
+        """
+        names = sorted(self.__by_name, key=lambda x: x.encode("utf-8"))
+        keys = sorted({id(x): x for x in self.__by_name.values()}.values(), key=lambda x: x.k)
+
+        data_offset = FILE_HEADER.size + len(names) * NAME_ENTRY.size + len(keys) * KEY_ENTRY.size
+        data = bytearray()
+
+        key_offsets: dict[int, int] = dict()
+        for public_key in keys:
+            key_offsets[id(public_key)] = data_offset + len(data)
+            data += packPublicKeyRecord(public_key)
+
+        name_table = bytearray()
+        for name in names:
+            name_bytes = name.encode("utf-8")
+            name_table += NAME_ENTRY.pack(data_offset + len(data), len(name_bytes),
+                                          key_offsets[id(self.__by_name[name])])
+            data += name_bytes
+
+        with open(path, "wb") as fp:
+            fp.write(FILE_HEADER.pack(FILE_MAGIC, VERSION, len(names), len(keys)))
+            fp.write(name_table)
+            fp.write(b"".join([KEY_ENTRY.pack(key_offsets[id(x)]) for x in keys]))
+            fp.write(data)
+
+
+class MappedPublicKeyDirectory:
+    """
+    Read-only directory on a file written by `PublicKeyDirectory.export`.
+    The file is memory-mapped, and a key is parsed only when it is looked up.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as fp:
+            self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.n_name, self.n_key = FILE_HEADER.unpack_from(self.mm, 0)
+        if magic != FILE_MAGIC or version != VERSION:
+            raise ValueError(f"\"{path}\" is not a GoldbachEnc public key directory (version {VERSION}).")
+
+        self.key_table_offset = FILE_HEADER.size + self.n_name * NAME_ENTRY.size
+        # Parsed keys, queried by the offset of its record, so a key is one object here also
+        self.parsed: dict[int, PublicKey] = dict()
+        # Names already looked up, so popular names skip the binary search
+        self.found: dict[str, PublicKey | None] = dict()
+
+    def getName(self, i: int) -> tuple[bytes, int]:
+        """
+        Name (in bytes) of the `i`-th entry of the name table, and offset of its key record.
+        """
+        name_offset, len_name, key_offset = NAME_ENTRY.unpack_from(self.mm, FILE_HEADER.size + i * NAME_ENTRY.size)
+        return self.mm[name_offset:name_offset + len_name], key_offset
+
+    def readKey(self, offset: int) -> PublicKey:
+        if offset in self.parsed:
+            return self.parsed[offset]
+
+        less_than_n_bit = struct.unpack_from("<I", self.mm, offset)[0]
+        offset_now = offset + 4
+        numbers = []
+        for _ in range(3):
+            size = struct.unpack_from("<I", self.mm, offset_now)[0]
+            numbers.append(int.from_bytes(self.mm[offset_now + 4:offset_now + 4 + size], "little"))
+            offset_now += 4 + size
+
+        k, a_inv, b_inv = numbers
+        public_key = self.parsed[offset] = PublicKey(a_inv, b_inv, k, less_than_n_bit)
+        return public_key
+
+    def lookup(self, name: str) -> PublicKey | None:
+        if name in self.found:
+            return self.found[name]
+
+        public_key = self.found[name] = self.searchName(name)
+        return public_key
+
+    def searchName(self, name: str) -> PublicKey | None:
+        target = name.encode("utf-8")
+
+        # Binary search on the name table
+        low, high = 0, self.n_name
+        while low < high:
+            middle = (low + high) // 2
+            if self.getName(middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == self.n_name:
+            return None
+        found, key_offset = self.getName(low)
+        return self.readKey(key_offset) if found == target else None
+
+    def lookupByK(self, k: int) -> PublicKey | None:
+        low, high = 0, self.n_key
+        while low < high:
+            middle = (low + high) // 2
+            key_offset = KEY_ENTRY.unpack_from(self.mm, self.key_table_offset + middle * KEY_ENTRY.size)[0]
+            if self.readKey(key_offset).k < k:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == self.n_key:
+            return None
+        public_key = self.readKey(KEY_ENTRY.unpack_from(self.mm, self.key_table_offset + low * KEY_ENTRY.size)[0])
+        return public_key if public_key.k == k else None
+
+    def names(self) -> Iterator[str]:
+        for i in range(self.n_name):
+            yield self.getName(i)[0].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self.n_name
+
+    def close(self) -> None:
+        self.mm.close()
+
+    def __enter__(self) -> "MappedPublicKeyDirectory":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class PublicKeyView(MutableMapping[str, PublicKey]):
+    """
+    What one user sees: every key of the shared directory, plus the keys only this user got.
+    Can be used as `User.key_of_others`, a user only takes memory for its own overrides.
+    """
+
+    __slots__ = ("directory", "overrides")
+
+    def __init__(self, directory: PublicKeyDirectory | MappedPublicKeyDirectory) -> None:
+        self.directory = directory
+        # Name -> key that differs from the directory, `None` means removed for this user.
+        #  Only made when there is the first override.
+        self.overrides: dict[str, PublicKey | None] = None
+
+    def __getitem__(self, name: str) -> PublicKey:
+        overrides = self.overrides
+        if overrides is None or name not in overrides:
+            public_key = self.directory.lookup(name)
+        else:
+            public_key = overrides[name]
+
+        if public_key is None:
+            raise KeyError(name)
+        return public_key
+
+    def __setitem__(self, name: str, public_key: PublicKey) -> None:
+        if isinstance(self.directory, PublicKeyDirectory):
+            public_key = self.directory.intern(public_key)
+
+        # Same as the directory, nothing to remember
+        shared = self.directory.lookup(name)
+        if shared is not None and getKeyValue(shared) == getKeyValue(public_key):
+            if self.overrides is not None:
+                self.overrides.pop(name, None)
+            return
+
+        if self.overrides is None:
+            self.overrides = dict()
+        self.overrides[name] = public_key
+
+    def __delitem__(self, name: str) -> None:
+        # Raise `KeyError` if not found
+        self[name]
+
+        if self.directory.lookup(name) is None:
+            del self.overrides[name]
+        else:
+            if self.overrides is None:
+                self.overrides = dict()
+            self.overrides[name] = None
+
+    def __iter__(self) -> Iterator[str]:
+        overrides = self.overrides or dict()
+        for name in self.directory.names():
+            if overrides.get(name, True) is not None:
+                yield name
+        for name, public_key in overrides.items():
+            if public_key is not None and self.directory.lookup(name) is None:
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
@@ -0,0 +1,173 @@
+from cryptfunc import GoldbachKey, generateKeyGoldbach
+from mathfunc import usePrimeTable
+from prime_table import PrimeTable
+
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from threading import Condition, Thread
+from time import perf_counter
+
+
+class KeyPool:
+    """
+    Keep some generated `GoldbachKey` ready, so getting a key does not need to wait for `genKeys`.
+
+    When the number of ready keys drops below `low_watermark`, a background thread
+    generates keys (on a thread pool, or a process pool if `use_process` is on)
+    until there are `high_watermark` keys again.
+
+    `prime_table` is the path of a table of `prime_table.py`, every worker process maps it
+    (with threads, it is used by the whole process until `close`).
+    """
+
+    def __init__(self, *,
+                 low_watermark: int = 4,
+                 high_watermark: int = 16,
+                 n_worker: int = 1,
+                 use_process: bool = False,
+                 key_generator: Callable[[], GoldbachKey] = generateKeyGoldbach,
+                 prime_table: str = None) -> None:
+        # Refilling starts below `low_watermark`, so with 0 it would never start
+        if not 1 <= low_watermark < high_watermark:
+            raise ValueError(f"Need 1 <= low_watermark < high_watermark, got {low_watermark} and {high_watermark}.")
+
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.key_generator = key_generator
+
+        self.__keys: deque[GoldbachKey] = deque()
+        self.__condition = Condition()
+        self.__closed = False
+        # What `key_generator` raised, given to `get` once the ready keys run out
+        self.__error: BaseException | None = None
+        # With threads, the table opened here, and the one used by this process before, given back on `close`
+        self.__prime_table: PrimeTable | None = None
+        self.__previous_prime_table: PrimeTable | None = None
+        if use_process:
+            # Every worker maps the table itself
+            initializer = dict()
+            if prime_table is not None:
+                initializer = dict(initializer=usePrimeTable, initargs=(prime_table,))
+            self.__executor: Executor = ProcessPoolExecutor(n_worker, **initializer)
+        else:
+            if prime_table is not None:
+                self.__prime_table = PrimeTable(prime_table)
+                self.__previous_prime_table = usePrimeTable(self.__prime_table)
+            self.__executor = ThreadPoolExecutor(n_worker)
+
+        # Statistics
+        self.n_generated = 0
+        self.n_taken = 0
+        self.n_stall = 0
+        self.stall_seconds = 0.0
+        self.refill_seconds = 0.0
+
+        self.__refill_thread = Thread(target=self.__refillLoop, name="KeyPool-refill", daemon=True)
+        self.__refill_thread.start()
+
+    def __refillLoop(self) -> None:
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__closed or len(self.__keys) < self.low_watermark)
+                if self.__closed:
+                    return
+                n_to_generate = self.high_watermark - len(self.__keys)
+
+            last_time = perf_counter()
+            futures = [self.__executor.submit(self.key_generator) for _ in range(n_to_generate)]
+            for future in as_completed(futures):
+                try:
+                    key = future.result()
+                except Exception as e:
+                    # Stop refilling, and wake the waiters so they raise it instead of waiting forever
+                    with self.__condition:
+                        self.__error = e
+                        self.__condition.notify_all()
+                    return
+
+                with self.__condition:
+                    # Counted key by key, so `refill_rate` is right while a refill is still running
+                    now = perf_counter()
+                    self.refill_seconds += now - last_time
+                    last_time = now
+
+                    if self.__closed:
+                        # Keys not generated yet are not needed any more
+                        for x in futures:
+                            x.cancel()
+                        return
+
+                    self.__keys.append(key)
+                    self.n_generated += 1
+                    self.__condition.notify_all()
+
+    def get(self, *, timeout: float = None) -> GoldbachKey:
+        """
+        Take one key from the pool. If the pool is empty, wait until it is refilled
+        (counted as a stall), and raise `TimeoutError` if waited more than `timeout`.
+        If `key_generator` failed, the pool is not refilled any more, and its error is raised once it is empty.
+        """
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError("The key pool is already closed.")
+
+            if len(self.__keys) == 0:
+                self.n_stall += 1
+                stall_start = perf_counter()
+                got_key = self.__condition.wait_for(
+                    lambda: len(self.__keys) > 0 or self.__closed or self.__error is not None, timeout)
+                self.stall_seconds += perf_counter() - stall_start
+
+                if not got_key:
+                    raise TimeoutError(f"No key is ready in the pool after {timeout} seconds.")
+                if len(self.__keys) == 0 and self.__error is not None:
+                    raise RuntimeError("The key pool can not generate keys.") from self.__error
+                if len(self.__keys) == 0:
+                    raise RuntimeError("The key pool is closed while waiting for a key.")
+
+            key = self.__keys.popleft()
+            self.n_taken += 1
+
+            # Wake the refill thread if reaching the low watermark
+            if len(self.__keys) < self.low_watermark:
+                self.__condition.notify_all()
+
+            return key
+
+    def getDepth(self) -> int:
+        return len(self.__keys)
+
+    def getStats(self) -> dict[str, int | float]:
+        return {
+            "depth": len(self.__keys),
+            "low_watermark": self.low_watermark,
+            "high_watermark": self.high_watermark,
+            "generated": self.n_generated,
+            "taken": self.n_taken,
+            "stalls": self.n_stall,
+            "stall_seconds": self.stall_seconds,
+            "failed": self.__error is not None,
+            # Keys generated per second while refilling
+            "refill_rate": self.n_generated / self.refill_seconds if self.refill_seconds > 0 else 0.0
+        }
+
+    def close(self) -> None:
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+        self.__refill_thread.join()
+        self.__executor.shutdown(cancel_futures=True)
+
+        if self.__prime_table is not None:
+            # No worker is left to read it
+            usePrimeTable(self.__previous_prime_table)
+            self.__prime_table.close()
+            self.__prime_table = None
+
+    def __enter__(self) -> "KeyPool":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
@@ -0,0 +1,330 @@
+from cryptfunc import GoldbachKey, PrivateKey, PublicKey
+from mathfunc import getRandomBelow
+
+from collections.abc import Iterator, Mapping
+from enum import Enum
+from random import Random
+from threading import Lock
+
+import mmap
+import os
+import struct
+
+
+# Layout of the keyring file (all numbers are little-endian):
+#
+# * Header: magic `GBKR`, version.
+# * Records, one after another, never changed once written. Each has
+#   operation, byte length of the name, of `k` and of the body, then `k`, the name and the body.
+#   - add: body is the key (`less_than_n_bit`, then `a`, `b`, `a_inv`, `b_inv` each with its byte length).
+#   - name: give the name to the key `k`, the name is taken from other key if it had it.
+#   - drop: remove the key `k` and its names.
+#
+# At opening only `k` and names are read, the body of a key is parsed when the key is used.
+
+FILE_HEADER = struct.Struct("<4sB")
+RECORD_HEADER = struct.Struct("<BHII")
+FILE_MAGIC = b"GBKR"
+VERSION = 1
+
+
+class RecordOp(Enum):
+    add = 1
+    name = 2
+    drop = 3
+
+
+def packKeyBody(goldbach_key: GoldbachKey) -> bytes:
+    public_key, private_key = goldbach_key.public_key, goldbach_key.private_key
+    body = [struct.pack("<I", public_key.less_than_n_bit)]
+    for x in (private_key.a, private_key.b, public_key.a_inv, public_key.b_inv):
+        x_bytes = x.to_bytes((x.bit_length() + 7) // 8, "little")
+        body += [struct.pack("<I", len(x_bytes)), x_bytes]
+
+    return b"".join(body)
+
+
+def unpackKeyBody(k: int, body: bytes | memoryview) -> GoldbachKey:
+    less_than_n_bit = struct.unpack_from("<I", body, 0)[0]
+    offset = 4
+    numbers = []
+    for _ in range(4):
+        size = struct.unpack_from("<I", body, offset)[0]
+        numbers.append(int.from_bytes(body[offset + 4:offset + 4 + size], "little"))
+        offset += 4 + size
+
+    a, b, a_inv, b_inv = numbers
+    return GoldbachKey(PublicKey(a_inv, b_inv, k, less_than_n_bit), PrivateKey(a, b))
+
+
+def packRecord(op: RecordOp, k: int, name: str = None, body: bytes = b"") -> bytes:
+    k_bytes = k.to_bytes((k.bit_length() + 7) // 8, "little")
+    name_bytes = b"" if name is None else name.encode("utf-8")
+    return RECORD_HEADER.pack(op.value, len(name_bytes), len(k_bytes), len(body)) + k_bytes + name_bytes + body
+
+
+class Keyring(Mapping[int, GoldbachKey]):
+    """
+    Private keys of a user, queried by `k` or by name. Keys without name are kept in a list,
+    so a random one can be picked in O(1).
+
+    If `path` is given, every change is appended to that file, and the keys in it are loaded
+    (lazily, by `mmap`) when opening. Call `compact` to drop the records of removed keys.
+    """
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+
+        # Parsed keys, and where the body of not parsed keys are, queried by `k`
+        self.__keys: dict[int, GoldbachKey] = dict()
+        self.__body_spans: dict[int, tuple[int, int]] = dict()
+        # Threads (like the executor of a messaging service) may ask for the same not parsed key together
+        self.__parse_lock = Lock()
+
+        self.__name_to_k: dict[str, int] = dict()
+        self.__names_of_k: dict[int, set[str]] = dict()
+        # Keys without name, and where each of them is in the list
+        self.__unnamed: list[int] = []
+        self.__unnamed_index: dict[int, int] = dict()
+
+        self.__mm: mmap.mmap = None
+        self.__fp = None
+        self.n_record = 0
+
+        if path is not None:
+            self.__open()
+
+    # Index is changed by the same methods when adding keys and when replaying the file
+    def __indexKey(self, k: int) -> None:
+        self.__names_of_k[k] = set()
+        self.__addUnnamed(k)
+
+    def __addUnnamed(self, k: int) -> None:
+        self.__unnamed_index[k] = len(self.__unnamed)
+        self.__unnamed.append(k)
+
+    def __removeUnnamed(self, k: int) -> None:
+        # Move the last one into the hole, so removing is O(1)
+        i = self.__unnamed_index.pop(k)
+        last = self.__unnamed.pop()
+        if last != k:
+            self.__unnamed[i] = last
+            self.__unnamed_index[last] = i
+
+    def __indexName(self, k: int, name: str) -> None:
+        old_k = self.__name_to_k.get(name)
+        if old_k == k:
+            return
+
+        if old_k is not None:
+            self.__names_of_k[old_k].discard(name)
+            if len(self.__names_of_k[old_k]) == 0:
+                self.__addUnnamed(old_k)
+
+        if len(self.__names_of_k[k]) == 0:
+            self.__removeUnnamed(k)
+        self.__names_of_k[k].add(name)
+        self.__name_to_k[name] = k
+
+    def __unindexKey(self, k: int) -> None:
+        names = self.__names_of_k.pop(k)
+        for name in names:
+            del self.__name_to_k[name]
+        if len(names) == 0:
+            self.__removeUnnamed(k)
+
+        self.__keys.pop(k, None)
+        self.__body_spans.pop(k, None)
+
+    def __open(self) -> None:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, "wb") as fp:
+                fp.write(FILE_HEADER.pack(FILE_MAGIC, VERSION))
+
+        with open(self.path, "rb") as fp:
+            self.__mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = FILE_HEADER.unpack_from(self.__mm, 0)
+        if magic != FILE_MAGIC or version != VERSION:
+            raise ValueError(f"\"{self.path}\" is not a GoldbachEnc keyring (version {VERSION}).")
+
+        end = self.__replay()
+        self.__fp = open(self.path, "r+b")
+        # Cut off a record which is not completely written (like power lost while writing)
+        if end < len(self.__mm):
+            self.__fp.truncate(end)
+        self.__fp.seek(end)
+
+    def __replay(self) -> int:
+        """
+        Build the index from the records, returns where the last complete record ends.
+        """
+        mm = self.__mm
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= len(mm):
+            op, len_name, len_k, len_body = RECORD_HEADER.unpack_from(mm, offset)
+            k_start = offset + RECORD_HEADER.size
+            body_start = k_start + len_k + len_name
+            if body_start + len_body > len(mm):
+                break
+
+            k = int.from_bytes(mm[k_start:k_start + len_k], "little")
+            match RecordOp(op):
+                case RecordOp.add if k not in self.__names_of_k:
+                    self.__indexKey(k)
+                    self.__body_spans[k] = (body_start, len_body)
+                case RecordOp.name if k in self.__names_of_k:
+                    self.__indexName(k, mm[k_start + len_k:body_start].decode("utf-8"))
+                case RecordOp.drop if k in self.__names_of_k:
+                    self.__unindexKey(k)
+
+            offset = body_start + len_body
+            self.n_record += 1
+
+        return offset
+
+    def __append(self, record: bytes) -> None:
+        self.n_record += 1
+        if self.__fp is None:
+            return
+
+        self.__fp.write(record)
+        self.__fp.flush()
+
+    def compact(self) -> None:
+        """
+        Rewrite the file with only the keys (and names) still there.
+        """
+        if self.path is None:
+            return
+
+        compact_path = self.path + ".compact"
+        with open(compact_path, "wb") as fp:
+            fp.write(FILE_HEADER.pack(FILE_MAGIC, VERSION))
+            for k in self:
+                if k in self.__body_spans:
+                    # Not parsed yet, just copy the bytes
+                    start, size = self.__body_spans[k]
+                    body = self.__mm[start:start + size]
+                else:
+                    body = packKeyBody(self.__keys[k])
+
+                fp.write(packRecord(RecordOp.add, k, body=body))
+                for name in self.__names_of_k[k]:
+                    fp.write(packRecord(RecordOp.name, k, name))
+
+        self.close()
+        os.replace(compact_path, self.path)
+
+        self.__keys.clear()
+        self.__body_spans.clear()
+        self.__name_to_k.clear()
+        self.__names_of_k.clear()
+        self.__unnamed.clear()
+        self.__unnamed_index.clear()
+        self.n_record = 0
+        self.__open()
+
+    def close(self) -> None:
+        if self.__fp is not None:
+            self.__fp.close()
+            self.__fp = None
+        if self.__mm is not None:
+            self.__mm.close()
+            self.__mm = None
+
+    def __enter__(self) -> "Keyring":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def add(self, goldbach_key: GoldbachKey, *, name: str = None) -> None:
+        k = goldbach_key.public_key.k
+
+        if k not in self.__names_of_k:
+            self.__indexKey(k)
+            self.__keys[k] = goldbach_key
+            self.__append(packRecord(RecordOp.add, k, body=packKeyBody(goldbach_key)))
+
+        if name is not None and self.__name_to_k.get(name) != k:
+            self.__indexName(k, name)
+            self.__append(packRecord(RecordOp.name, k, name))
+
+    def drop(self, k: int) -> None:
+        if k not in self.__names_of_k:
+            raise KeyError(f"Key with k = {k} is not in the keyring.")
+
+        self.__unindexKey(k)
+        self.__append(packRecord(RecordOp.drop, k))
+
+    def __getitem__(self, k: int) -> GoldbachKey:
+        goldbach_key = self.__keys.get(k)
+        if goldbach_key is not None:
+            return goldbach_key
+
+        # Parse the key at the first time it is used, only once even if threads ask for it together
+        with self.__parse_lock:
+            if k in self.__keys:
+                return self.__keys[k]
+
+            start, size = self.__body_spans[k]
+            goldbach_key = self.__keys[k] = unpackKeyBody(k, self.__mm[start:start + size])
+            # Dropped only after it is parsed, so the key is always in one of them
+            del self.__body_spans[k]
+
+        return goldbach_key
+
+    def __contains__(self, k: object) -> bool:
+        return k in self.__names_of_k
+
+    def __len__(self) -> int:
+        return len(self.__names_of_k)
+
+    def __iter__(self) -> Iterator[int]:
+        # Not a copy, so do not add or drop keys while iterating (iterate a `list` of it for that)
+        return iter(self.__names_of_k)
+
+    def getDefault(self) -> GoldbachKey:
+        """
+        The oldest key still in the keyring, in O(1) (no copy of the keys).
+        """
+        for k in self.__names_of_k:
+            return self[k]
+
+        raise KeyError("There is no key in the keyring.")
+
+    def getByName(self, name: str) -> GoldbachKey:
+        return self[self.__name_to_k[name]]
+
+    def getKOfName(self, name: str) -> int:
+        return self.__name_to_k[name]
+
+    def hasName(self, name: str) -> bool:
+        return name in self.__name_to_k
+
+    def getNamesOf(self, k: int) -> set[str]:
+        return set(self.__names_of_k[k])
+
+    def getUnnamedCount(self) -> int:
+        return len(self.__unnamed)
+
+    def chooseUnnamed(self, *, rng: Random = None) -> GoldbachKey:
+        """
+        A random key which has no name.
+        """
+        if len(self.__unnamed) == 0:
+            raise KeyError("There is no key without name in the keyring.")
+
+        return self[self.__unnamed[getRandomBelow(len(self.__unnamed), rng=rng)]]
+
+    def getStats(self) -> dict[str, int]:
+        return {
+            "keys": len(self),
+            "unnamed": len(self.__unnamed),
+            "names": len(self.__name_to_k),
+            "parsed": len(self.__keys),
+            "records": self.n_record,
+            # Records which `compact` would drop
+            "dead_records": self.n_record - len(self) - len(self.__name_to_k),
+        }
@@ -1,19 +1,153 @@
-from rsa.prime import getprime, are_relatively_prime, is_prime
+from prime_table import PrimeTable
+
+from enum import Enum
 from functools import reduce
+from math import gcd, isqrt, prod
 from operator import mul, or_
+from random import Random
 from secrets import randbelow
 
+import arithmetic
+import instrument
+
+try:
+    from rsa.prime import getprime, are_relatively_prime
+except ImportError:
+    # Only needed by `PrimeBackend.rsa`
+    getprime = are_relatively_prime = None
+
+
+class PrimeBackend(Enum):
+    # Wheel, trial division by gcd, then Miller-Rabin, in `genPrimeNative`
+    native = 1
+    # `rsa.prime.getprime`, the original way
+    rsa = 2
+
+
+def sieveSmallPrimes(until: int) -> list[int]:
+    is_prime = bytearray([1]) * (until + 1)
+    is_prime[0:2] = b"\x00\x00"
+
+    for i in range(2, isqrt(until) + 1):
+        if is_prime[i]:
+            is_prime[i * i::i] = bytes(len(range(i * i, until + 1, i)))
+
+    return [i for i in range(until + 1) if is_prime[i]]
+
+
+# Primes not more than this bit are picked from `SMALL_PRIMES` directly
+SMALL_PRIMES_MAX_BIT = 11
+SMALL_PRIMES = sieveSmallPrimes(1 << SMALL_PRIMES_MAX_BIT)
+SMALL_PRIMES_SET = frozenset(SMALL_PRIMES)
+# Dividing by every small prime is same as one gcd with their product
+SMALL_PRIMES_PRODUCT = prod(SMALL_PRIMES)
+
+# Candidates are always coprime with 2, 3, 5, 7
+WHEEL_MODULUS = 2 * 3 * 5 * 7
+WHEEL_RESIDUES = [r for r in range(WHEEL_MODULUS) if gcd(r, WHEEL_MODULUS) == 1]
 
-def isPrime(n: int) -> bool: return is_prime(n)
+# If n is less than the bound, testing these bases is enough to tell whether n is prime
+MILLER_RABIN_DETERMINISTIC_BASES = [
+    (2_047, [2]),
+    (1_373_653, [2, 3]),
+    (4_759_123_141, [2, 7, 61]),
+    (3_474_749_660_383, [2, 3, 5, 7, 11, 13]),
+    (341_550_071_728_321, [2, 3, 5, 7, 11, 13, 17]),
+    (3_825_123_056_546_413_051, [2, 3, 5, 7, 11, 13, 17, 19, 23]),
+    (318_665_857_834_031_151_167_461, [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37]),
+    (3_317_044_064_679_887_385_961_981, [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]),
+]
 
 
-def isCoprime(a: int, b: int) -> bool: return are_relatively_prime(a, b)
+def getMillerRabinBases(n: int) -> list[int]:
+    for bound, bases in MILLER_RABIN_DETERMINISTIC_BASES:
+        if n < bound:
+            return bases
+
+    # Same number of rounds as `rsa.prime`, base 2 first since it rejects most composite
+    n_bit = n.bit_length()
+    n_round = 3 if n_bit >= 1536 else 4 if n_bit >= 1024 else 7 if n_bit >= 512 else 10
+    return [2] + [randbelow(n - 4) + 3 for _ in range(n_round)]
+
+
+def isMillerRabinPrime(n: int, bases: list[int]) -> bool:
+    """
+    `n` should be odd and bigger than every base. Stop at the first base that proves `n` composite.
+    """
+    # n - 1 = d * 2^s
+    s = ((n - 1) & (1 - n)).bit_length() - 1
+    d = (n - 1) >> s
+
+    for base in bases:
+        x = arithmetic.powMod(base, d, n)
+        if x == 1 or x == n - 1:
+            continue
+
+        for _ in range(s - 1):
+            x = arithmetic.powMod(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+
+    return True
 
 
-def isNotCoprime(a: int, b: int) -> bool: return not are_relatively_prime(a, b)
+# Table of `prime_table.py` that `genPrimeNative` draws from for the sizes it covers, see `usePrimeTable`
+prime_table: PrimeTable | None = None
 
 
-def genPrime(*, n_bit: int = 64, exclude: list[int] = None, coprime_with: list[int] = None) -> int:
+def usePrimeTable(table: str | PrimeTable | None) -> PrimeTable | None:
+    """
+    Draw primes from `table` (or the table file at this path, built by `prime_table.buildPrimeTable`) from now on
+    (for every thread), for the sizes it covers. `None` stops using it.
+    Returns the table used before, to give back here later. It is not closed, other threads may still be reading it.
+
+    A table opened from a path here is never closed (fine for the `initializer` of a process pool,
+    then every worker maps the same file until it exits). Open the `PrimeTable` and give it instead to close it.
+    """
+    global prime_table
+    old_table, prime_table = prime_table, PrimeTable(table) if isinstance(table, str) else table
+    return old_table
+
+
+def isPrime(n: int) -> bool:
+    if n <= SMALL_PRIMES[-1]:
+        return n in SMALL_PRIMES_SET
+
+    # Read the global once, another thread may swap it
+    table = prime_table
+    if table is not None and table.covers(n.bit_length()):
+        return table.isPrime(n)
+
+    if arithmetic.gcd(n, SMALL_PRIMES_PRODUCT) != 1:
+        return False
+
+    return isMillerRabinPrime(n, getMillerRabinBases(n))
+
+
+def isCoprime(a: int, b: int) -> bool: return gcd(a, b) == 1
+
+
+def isNotCoprime(a: int, b: int) -> bool: return gcd(a, b) != 1
+
+
+def genPrime(*, n_bit: int = 64, exclude: list[int] = None, coprime_with: list[int] = None,
+             backend: PrimeBackend = PrimeBackend.native,
+             rng: Random = None, stats: dict[str, int] = None) -> int:
+    """
+    Generate a prime of exact `n_bit` bits, which is not in `exclude`,
+    and coprime with every number in `coprime_with`.
+
+    `rng` is only for reproducible result (like benchmark), and only used by `PrimeBackend.native`,
+    so is `stats` (see `genKeys`).
+    """
+    if backend == PrimeBackend.native:
+        return genPrimeNative(n_bit=n_bit, exclude=exclude, coprime_with=coprime_with, rng=rng, stats=stats)
+
+    if getprime is None:
+        raise ModuleNotFoundError("PrimeBackend.rsa needs the `rsa` module.")
+
     p = getprime(n_bit)
 
     if exclude is not None or coprime_with is not None:
@@ -24,62 +158,186 @@ def genPrime(*, n_bit: int = 64, exclude: list[int] = None, coprime_with: list[i
                 p = getprime(n_bit)
         elif exclude is not None:
             while p in exclude:
-                p = getprime()
+                p = getprime(n_bit)
         else:  # only coprime_with option is on
-            while reduce(or_, [isNotCoprime(p, x) for x in coprime_with]):
+            while reduce(or_, [not are_relatively_prime(p, x) for x in coprime_with]):
                 p = getprime(n_bit)
 
     return p
 
 
+def genPrimeNative(*, n_bit: int = 64, exclude: list[int] = None, coprime_with: list[int] = None,
+                   rng: Random = None, stats: dict[str, int] = None) -> int:
+    exclude = frozenset() if exclude is None else frozenset(exclude)
+    coprime_product = 1 if coprime_with is None else prod(coprime_with)
+
+    if n_bit < 2:
+        raise ValueError(f"There is no prime with {n_bit} bit.")
+
+    # Small enough, pick from the known primes
+    if n_bit <= SMALL_PRIMES_MAX_BIT:
+        candidates = [p for p in SMALL_PRIMES
+                      if p.bit_length() == n_bit and p not in exclude and gcd(p, coprime_product) == 1]
+        if len(candidates) == 0:
+            raise ValueError(f"No {n_bit} bit prime is out of `exclude` and coprime with `coprime_with`.")
+        return candidates[getRandomBelow(len(candidates), rng=rng)]
+
+    table = prime_table
+    if table is not None and table.covers(n_bit):
+        return genPrimeFromTable(table, n_bit=n_bit, exclude=exclude, coprime_product=coprime_product,
+                                 rng=rng, stats=stats)
+
+    # One gcd does both trial division and the `coprime_with` check
+    screen = SMALL_PRIMES_PRODUCT * coprime_product
+    lowest = 1 << (n_bit - 1)
+
+    n_candidate = 0
+    while True:
+        n_candidate += 1
+        # Random number of `n_bit` bit, then move it onto the wheel
+        p = lowest + getRandomBelow(lowest, rng=rng)
+        p += WHEEL_RESIDUES[getRandomBelow(len(WHEEL_RESIDUES), rng=rng)] - p % WHEEL_MODULUS
+        if p < lowest or p >= lowest << 1:
+            continue
+
+        if arithmetic.gcd(p, screen) != 1 or p in exclude:
+            continue
+
+        if isMillerRabinPrime(p, getMillerRabinBases(p)):
+            addStats(stats, "genPrime.candidates", n_candidate)
+            return p
+
+
+def genPrimeFromTable(table: PrimeTable, *, n_bit: int, exclude: frozenset[int], coprime_product: int,
+                      rng: Random = None, stats: dict[str, int] = None) -> int:
+    """
+    Uniformly random prime of `n_bit` bit: draw numbers on the wheel until the table says it is a prime.
+    Every prime of this size is on the wheel, and a wheel number is prime at about `4.4 / (n_bit * ln(2))`,
+    so it takes about 7 draws for 32 bit, each is a read of one byte.
+    """
+    lowest = 1 << (n_bit - 1)
+    # Whole turns of the wheel covering `[lowest, 2 * lowest)`, numbers out of the range are drawn again
+    first_turn = lowest // WHEEL_MODULUS
+    n_wheel_number = (-(-2 * lowest // WHEEL_MODULUS) - first_turn) * len(WHEEL_RESIDUES)
+
+    n_candidate = 0
+    while True:
+        n_candidate += 1
+        turn, residue = divmod(getRandomBelow(n_wheel_number, rng=rng), len(WHEEL_RESIDUES))
+        p = (first_turn + turn) * WHEEL_MODULUS + WHEEL_RESIDUES[residue]
+        if p < lowest or p >= lowest << 1:
+            continue
+
+        if table.isPrime(p) and p not in exclude and gcd(p, coprime_product) == 1:
+            addStats(stats, "genPrime.candidates", n_candidate)
+            return p
+
+
 def getModInverse(of: int, under_mod: int, *,
                   get_random: bool = False,
                   bigger_than: int = None,
                   enlarge_range_left: int = -99,
-                  enlarge_range_right: int = 99):
-    result = pow(of, -1, under_mod)
+                  enlarge_range_right: int = 99,
+                  rng: Random = None):
+    result = arithmetic.invert(of, under_mod)
 
     if get_random:
         # Bigger Than Mode
         if bigger_than is not None:
-            while result <= bigger_than:
-                result += getSafeRandomInt(1, under_mod**4) * under_mod
+            result = liftAbove(result, under_mod, bigger_than, rng=rng)
         else:
-            result += getSafeRandomInt(int(enlarge_range_left), int(enlarge_range_right)) * under_mod
+            result += getSafeRandomInt(int(enlarge_range_left), int(enlarge_range_right), rng=rng) * under_mod
 
     return result
 
 
-def genKeys(*, a_bit: int = 16, b_bit: int = 16) -> tuple[int, int, int, int, int, int, int]:
+def liftAbove(x: int, step: int, bigger_than: int, *, n_choice: int = None, rng: Random = None) -> int:
+    """
+    `x + m * step` which is bigger than `bigger_than`, in one step (no retry loop).
+    `m` is random out of `n_choice` choices (`bigger_than // step` by default),
+    so the result is in `(bigger_than, bigger_than + (n_choice + 1) * step]`.
+
+    When `bigger_than` is times of `step` (like `k` of `n`), the default makes the result mod `bigger_than`
+    uniform over every number that is `x` mod `step`.
+    """
+    n_choice = max(1, bigger_than // step) if n_choice is None else n_choice
+    # The smallest `m` that goes over `bigger_than`
+    lowest_m = max(0, (bigger_than - x) // step + 1)
+    return x + (lowest_m + getRandomBelow(n_choice, rng=rng)) * step
+
+
+def addStats(stats: dict[str, int] | None, name: str, n: int = 1) -> None:
+    instrument.count(name, n)
+    if stats is not None:
+        stats[name] = stats.get(name, 0) + n
+
+
+def genFactorPrime(n: int, *, prime_backend: PrimeBackend = PrimeBackend.native,
+                   rng: Random = None, stats: dict[str, int] = None) -> int:
+    """
+    One prime factor of `k`: coprime with `n`, of a random size from 4 bit to the size of `n`.
+
+    Every prime of a small size can divide `n` (like 11 and 13, the only 4 bit primes, when 143 divides `n`),
+    then `genPrime` raises `ValueError`, and another size is drawn out of the ones not tried yet.
+    Raises `ArithmeticError` if no size has a prime to use.
+    """
+    # At least 4 bit, even if `n` is smaller
+    factor_bits = list(range(4, max(4, n.bit_length()) + 1))
+    while factor_bits:
+        factor_bit = factor_bits.pop(getRandomBelow(len(factor_bits), rng=rng))
+        try:
+            return genPrime(n_bit=factor_bit, coprime_with=[n], backend=prime_backend, rng=rng, stats=stats)
+        except ValueError:
+            addStats(stats, "genKeys.factor_retries")
+
+    raise ArithmeticError(f"No prime of 4 to {max(4, n.bit_length())} bit is coprime with n = {n}.")
+
+
+def genKeys(*, a_bit: int = 16, b_bit: int = 16,
+            prime_backend: PrimeBackend = PrimeBackend.native,
+            rng: Random = None,
+            stats: dict[str, int] = None) -> tuple[int, int, int, int, int, int]:
     """
     n = a + b.
+
+    If `stats` is given, the retries are added to it: "genPrime.candidates" (numbers tested to find the primes,
+    native backend only) and "genKeys.factor_retries" (sizes of the factors of `k` that had no prime to use).
     """
-    a, b, n = 0, 0, 0
-    a_inv, b_inv = 0, 0
-    while True:
-        # Generate a, b, n
-        a, b = genPrime(n_bit=a_bit), genPrime(n_bit=b_bit)
+    with instrument.stage("mathfunc.genKeys"):
+        # Generate a, b, n.
+        # Any two different primes are a good pair: gcd(a, a + b) = gcd(a, b) = 1, same for b,
+        #  so drawing `b` out of the primes other than `a` never needs a retry.
+        a = genPrime(n_bit=a_bit, backend=prime_backend, rng=rng, stats=stats)
+        b = genPrime(n_bit=b_bit, exclude=[a], backend=prime_backend, rng=rng, stats=stats)
         n = a + b  # Goldbach here!
-        n_a_b_not_coprime = not (isCoprime(a, n) and isCoprime(b, n))
-        if n_a_b_not_coprime:
-            continue
 
-        break
+        # Checkpoint: a, b and n must be pairwise coprime, or there is no inverse
+        if not (isCoprime(a, n) and isCoprime(b, n)):
+            raise ArithmeticError(f"a = {a} and b = {b} are not coprime with n = {n}.")
 
-    # Get enlarge factor `k`, this makes k harder to decode to `n`
-    k = n * reduce(mul, [genPrime(n_bit=getSafeRandomInt(4, n.bit_length()), coprime_with=[n]) for _ in range(4)])
+        # Get enlarge factor `k`, this makes k harder to decode to `n`
+        k = n * reduce(mul, [genFactorPrime(n, prime_backend=prime_backend, rng=rng, stats=stats)
+                             for _ in range(4)])
+
+        # Find the a^-1 and b^-1 according to n
+        a_inv = getModInverse(a, n, get_random=True, bigger_than=k, rng=rng)
+        b_inv = getModInverse(b, n, get_random=True, bigger_than=k, rng=rng)
+        # Make them big enough, so they can perform "mod k",
+        #  and let the encrypted message not able to be calc (if m * a_inv < k, it is obvious to steal)
 
-    # Find the a^-1 and b^-1 according to n
-    a_inv = getModInverse(a, n, get_random=True, bigger_than=k)
-    b_inv = getModInverse(b, n, get_random=True, bigger_than=k)
-    # Make them big enough, so they can perform "mod k",
-    #  and let the encrypted message not able to be calc (if m * a_inv < k, it is obvious to steal)
     return a, b, n, a_inv, b_inv, k
 
 
-def getSafeRandomInt(start: int = 0, until: int = 100) -> int:
+def getSafeRandomInt(start: int = 0, until: int = 100, *, rng: Random = None) -> int:
     """
     Both side inclusive. `until` must be greater than `start`.
     """
 
-    return randbelow(1 + until - start) + start
+    return getRandomBelow(1 + until - start, rng=rng) + start
+
+
+def getRandomBelow(n: int, *, rng: Random = None) -> int:
+    """
+    Use `secrets` by default. Give `rng` only if the result need to be reproduced (like benchmark).
+    """
+    return randbelow(n) if rng is None else rng.randrange(n)
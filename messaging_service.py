@@ -0,0 +1,406 @@
+from cryptfunc import BlockArray, Compression, GoldbachEncMessage, PublicKey, getBlockWidth
+from simulation_entities import User
+from workload import getPercentile, makeCorpus
+
+from argparse import ArgumentParser
+from concurrent.futures import Executor
+from enum import Enum
+from functools import partial
+from time import perf_counter
+
+import asyncio
+import struct
+
+
+# Every frame is: type (u8), request id (u32), payload length (u32), then the payload.
+#  Response has the same request id as the request, so a connection can have many requests on the fly.
+FRAME_HEADER = struct.Struct("<BII")
+MAX_PAYLOAD = 1 << 30
+# Seconds a client waits for the response of one request
+REQUEST_TIMEOUT = 60.0
+
+
+class FrameType(Enum):
+    # Payload: name, then the public key. Server saves it and answers its own `public_key`.
+    public_key = 1
+    # Payload: name of the sender, then the message. Server answers the message encrypted back to the sender.
+    enc_message = 2
+    # Payload: UTF-8 text of the error.
+    error = 3
+
+
+def packInt(x: int) -> bytes:
+    x_bytes = x.to_bytes((x.bit_length() + 7) // 8, "little")
+    return struct.pack("<I", len(x_bytes)) + x_bytes
+
+
+def unpackInt(data: bytes | memoryview, offset: int) -> tuple[int, int]:
+    """
+    Returns the number, and the offset after it.
+    """
+    size = struct.unpack_from("<I", data, offset)[0]
+    offset += 4
+    return int.from_bytes(data[offset:offset + size], "little"), offset + size
+
+
+def packName(name: str) -> bytes:
+    name_bytes = name.encode("utf-8")
+    return struct.pack("<H", len(name_bytes)) + name_bytes
+
+
+def unpackName(data: bytes | memoryview, offset: int) -> tuple[str, int]:
+    size = struct.unpack_from("<H", data, offset)[0]
+    offset += 2
+    return bytes(data[offset:offset + size]).decode("utf-8"), offset + size
+
+
+def packPublicKey(public_key: PublicKey) -> bytes:
+    return (struct.pack("<I", public_key.less_than_n_bit)
+            + packInt(public_key.a_inv) + packInt(public_key.b_inv) + packInt(public_key.k))
+
+
+def unpackPublicKey(data: bytes | memoryview, offset: int) -> tuple[PublicKey, int]:
+    less_than_n_bit = struct.unpack_from("<I", data, offset)[0]
+    a_inv, offset = unpackInt(data, offset + 4)
+    b_inv, offset = unpackInt(data, offset)
+    k, offset = unpackInt(data, offset)
+    return PublicKey(a_inv, b_inv, k, less_than_n_bit), offset
+
+
+def packEncMessage(enc_message: GoldbachEncMessage) -> bytes:
+    """
+    `k`, number of blocks, compression, then every block in the same width (byte length of `k`).
+    """
+    width = getBlockWidth(enc_message.k)
+    blocks = enc_message.message
+    # `BlockArray` is already in this layout
+    if not (isinstance(blocks, BlockArray) and blocks.width == width):
+        blocks = BlockArray.fromBlocks(blocks, width)
+    return (packInt(enc_message.k) + struct.pack("<IB", len(blocks), enc_message.compression.value)
+            + blocks.memoryview())
+
+
+def unpackEncMessage(data: bytes | memoryview, offset: int) -> tuple[GoldbachEncMessage, int]:
+    k, offset = unpackInt(data, offset)
+    n_block, compression = struct.unpack_from("<IB", data, offset)
+    offset += 5
+
+    width = getBlockWidth(k)
+    stop = offset + n_block * width
+    return GoldbachEncMessage(BlockArray(width, data[offset:stop]), k, compression=Compression(compression)), stop
+
+
+async def readFrame(reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+    """
+    Frame type is given as the raw number, so an unknown type fails only its own request (see `FrameType`).
+    """
+    frame_type, request_id, size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+
+    # Checkpoint: A broken peer should not make us allocate a huge buffer
+    if size > MAX_PAYLOAD:
+        raise ValueError(f"Frame payload of {size} bytes is more than the limit {MAX_PAYLOAD}.")
+
+    return frame_type, request_id, await reader.readexactly(size)
+
+
+def makeFrame(frame_type: FrameType, request_id: int, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(frame_type.value, request_id, len(payload)) + payload
+
+
+class MessagingServer:
+    """
+    Serve `user` on a TCP port. Clients exchange public keys with it and send it encrypted messages,
+    which are decrypted and sent back encrypted by the sender's key (echo).
+
+    Encryption and decryption run on `executor` (default executor of the loop if not given),
+    so the event loop keeps serving other connections meanwhile.
+    """
+
+    def __init__(self, user: User, *, host: str = "127.0.0.1", port: int = 0, executor: Executor = None) -> None:
+        self.user = user
+        self.host = host
+        self.port = port
+        self.executor = executor
+        self.server: asyncio.Server = None
+
+        if len(user.key_holder) == 0:
+            user.generateKey()
+
+        # Statistics
+        self.n_connection = 0
+        self.n_message = 0
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handleConnection, self.host, self.port)
+        # Port 0 means any free port, so read back which one is used
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def __aenter__(self) -> "MessagingServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def handleConnection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.n_connection += 1
+        tasks: set[asyncio.Task] = set()
+
+        try:
+            while True:
+                try:
+                    frame = await readFrame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+                    # Closed, or the frames can not be followed any more (too big payload)
+                    break
+
+                # Handle each request in its own task, so a slow one does not hold back the pipeline
+                task = asyncio.create_task(self.handleFrame(writer, *frame))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def handleFrame(self, writer: asyncio.StreamWriter, frame_type: int, request_id: int,
+                          payload: bytes) -> None:
+        try:
+            # Unknown type raises `ValueError`, and is answered as an error
+            match FrameType(frame_type):
+                case FrameType.public_key:
+                    name, offset = unpackName(payload, 0)
+                    public_key, _ = unpackPublicKey(payload, offset)
+                    self.user.savePublicKey(name, public_key)
+
+                    my_key = self.user.key_holder.getDefault().public_key
+                    response = makeFrame(FrameType.public_key, request_id,
+                                         packName(self.user.name) + packPublicKey(my_key))
+                case FrameType.enc_message:
+                    name, offset = unpackName(payload, 0)
+                    enc_message, _ = unpackEncMessage(payload, offset)
+                    reply = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, self.echoMessage, name, enc_message)
+                    self.n_message += 1
+                    response = makeFrame(FrameType.enc_message, request_id, packEncMessage(reply))
+                case _:
+                    raise ValueError(f"Server does not accept frame type {FrameType(frame_type).name}.")
+        # `struct.error` and `IndexError` are from truncated payloads
+        except (KeyError, ValueError, ArithmeticError, UnicodeDecodeError, struct.error, IndexError) as e:
+            response = makeFrame(FrameType.error, request_id, str(e).encode("utf-8"))
+
+        # The client may already be gone, nothing to do then
+        if writer.is_closing():
+            return
+        try:
+            writer.write(response)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def echoMessage(self, name: str, enc_message: GoldbachEncMessage) -> GoldbachEncMessage:
+        # Reply compressed the same way
+        return self.user.sendEncMsgTo(name, self.user.decryptEncMsg(enc_message), compression=enc_message.compression)
+
+
+class ServiceConnection:
+    """
+    One TCP connection to the server. Requests are written at once without waiting for the former ones,
+    and responses are matched back by request id.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.next_request_id = 0
+        self.pending: dict[int, asyncio.Future] = dict()
+        self.receive_task = asyncio.create_task(self.receiveLoop())
+
+    async def receiveLoop(self) -> None:
+        try:
+            while True:
+                frame_type, request_id, payload = await readFrame(self.reader)
+                future = self.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+
+                try:
+                    future.set_result((FrameType(frame_type), payload))
+                except ValueError as e:
+                    future.set_exception(e)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Connection to the server is lost ({e})."))
+            self.pending.clear()
+
+    async def request(self, frame_type: FrameType, payload: bytes, *,
+                      timeout: float = REQUEST_TIMEOUT) -> tuple[FrameType, bytes]:
+        """
+        Raise `TimeoutError` if there is no response in `timeout` seconds (`None` waits forever).
+        """
+        request_id = self.next_request_id
+        self.next_request_id = (self.next_request_id + 1) & 0xFFFFFFFF
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(makeFrame(frame_type, request_id, payload))
+        await self.writer.drain()
+
+        try:
+            response_type, response = await asyncio.wait_for(future, timeout)
+        except TimeoutError:
+            # A late response is dropped by `receiveLoop`
+            self.pending.pop(request_id, None)
+            raise TimeoutError(f"No response of request {request_id} in {timeout} seconds.")
+        if response_type == FrameType.error:
+            raise RuntimeError(f"Server error: {response.decode('utf-8')}")
+        return response_type, response
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.receive_task
+
+
+class ConnectionPool:
+    """
+    A few connections shared by many clients, requests are spread over them by turns.
+    """
+
+    def __init__(self, host: str, port: int, *, size: int = 4) -> None:
+        self.host = host
+        self.port = port
+        self.size = size
+        self.connections: list[ServiceConnection] = []
+        self.next_connection = 0
+
+    async def open(self) -> None:
+        for _ in range(self.size):
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            self.connections.append(ServiceConnection(reader, writer))
+
+    async def close(self) -> None:
+        await asyncio.gather(*[connection.close() for connection in self.connections])
+        self.connections.clear()
+
+    async def __aenter__(self) -> "ConnectionPool":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def request(self, frame_type: FrameType, payload: bytes, *,
+                      timeout: float = REQUEST_TIMEOUT) -> tuple[FrameType, bytes]:
+        connection = self.connections[self.next_connection]
+        self.next_connection = (self.next_connection + 1) % len(self.connections)
+        return await connection.request(frame_type, payload, timeout=timeout)
+
+
+class ServiceClient:
+    """
+    `user` talking to the server through `pool`. Crypto work runs on `executor`.
+    """
+
+    def __init__(self, user: User, pool: ConnectionPool, *, executor: Executor = None) -> None:
+        self.user = user
+        self.pool = pool
+        self.executor = executor
+        self.server_name: str = None
+
+    async def exchangeKeys(self) -> None:
+        if len(self.user.key_holder) == 0:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.user.generateKey)
+
+        my_key = self.user.key_holder.getDefault().public_key
+        _, response = await self.pool.request(FrameType.public_key, packName(self.user.name) + packPublicKey(my_key))
+
+        self.server_name, offset = unpackName(response, 0)
+        self.user.savePublicKey(self.server_name, unpackPublicKey(response, offset)[0])
+
+    async def sendMessage(self, message: str, *, compression: Compression = Compression.none) -> str:
+        """
+        Send `message` to the server, and return the echo from it (decrypted).
+        """
+        if self.server_name is None:
+            await self.exchangeKeys()
+
+        loop = asyncio.get_running_loop()
+        enc_message = await loop.run_in_executor(self.executor, partial(self.user.sendEncMsgTo, self.server_name,
+                                                                        message, compression=compression))
+        _, response = await self.pool.request(FrameType.enc_message,
+                                              packName(self.user.name) + packEncMessage(enc_message))
+        return await loop.run_in_executor(self.executor, self.user.decryptEncMsg, unpackEncMessage(response, 0)[0])
+
+
+async def runLoadTest(*, n_user: int = 1000, n_message_per_user: int = 10, message_size: int = 64,
+                      n_connection: int = 8, executor: Executor = None, seed: int = 0) -> dict:
+    """
+    Start a server in this process, then let `n_user` users send messages to it at the same time.
+    Each user sends its messages one by one, and waits for each echo.
+    """
+    message = makeCorpus("ascii", message_size, seed=seed)
+
+    async with MessagingServer(User("Server"), executor=executor) as server, \
+            ConnectionPool(server.host, server.port, size=n_connection) as pool:
+        clients = [ServiceClient(User(f"User {i}"), pool, executor=executor) for i in range(n_user)]
+
+        start = perf_counter()
+        await asyncio.gather(*[client.exchangeKeys() for client in clients])
+        key_exchange_seconds = perf_counter() - start
+
+        latencies: list[float] = []
+
+        async def runUser(client: ServiceClient) -> None:
+            for _ in range(n_message_per_user):
+                send_start = perf_counter()
+                echo = await client.sendMessage(message)
+                latencies.append(perf_counter() - send_start)
+
+                # Checkpoint: The echo should be exactly what we sent
+                if echo != message:
+                    raise ValueError(f"Echo of user \"{client.user.name}\" is not the message sent.")
+
+        start = perf_counter()
+        await asyncio.gather(*[runUser(client) for client in clients])
+        seconds = perf_counter() - start
+
+        for client in clients:
+            client.user.close()
+        server.user.close()
+
+    latencies.sort()
+    return {
+        "n_user": n_user,
+        "n_message": len(latencies),
+        "message_size": message_size,
+        "n_connection": n_connection,
+        "key_exchange_seconds": key_exchange_seconds,
+        "seconds": seconds,
+        "messages_per_second": len(latencies) / seconds,
+        "p50_seconds": getPercentile(latencies, 50),
+        "p99_seconds": getPercentile(latencies, 99),
+        "p999_seconds": getPercentile(latencies, 99.9),
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Load test of GoldbachEnc messaging service on localhost.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=10, help="Messages sent by each user.")
+    parser.add_argument("--size", type=int, default=64, help="Bytes of each message.")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = asyncio.run(runLoadTest(n_user=args.users, n_message_per_user=args.messages, message_size=args.size,
+                                     n_connection=args.connections, seed=args.seed))
+    print(f"{report['n_message']} messages from {report['n_user']} users in {report['seconds']:.3f}s "
+          f"({report['messages_per_second']:.1f} msg/s), key exchange {report['key_exchange_seconds']:.3f}s")
+    print(f"latency p50 {report['p50_seconds'] * 1e3:.3f}ms  p99 {report['p99_seconds'] * 1e3:.3f}ms  "
+          f"p99.9 {report['p999_seconds'] * 1e3:.3f}ms")
@@ -0,0 +1,198 @@
+from cryptfunc import BlockArray, KeyContext, PrivateKey, PublicKey, getBlockWidth
+from str_manip import BlockPacker, BlockUnpacker
+
+from collections.abc import Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from os import cpu_count
+from time import perf_counter
+
+import arithmetic
+
+
+# 8 blocks of `n_bit` bits are exactly `n_bit` bytes, so if every shard holds times of 8 blocks,
+#  each shard starts at a byte boundary of the plaintext, and shards do not share any byte.
+BLOCKS_PER_ALIGN = 8
+
+
+def splitShards(n_block: int, n_shard: int) -> list[tuple[int, int]]:
+    """
+    Split `[0, n_block)` into at most `n_shard` ranges, each (except the last) has times of 8 blocks.
+    """
+    n_align = -(-n_block // BLOCKS_PER_ALIGN)
+    align_per_shard = max(1, -(-n_align // n_shard))
+    shard_n_block = align_per_shard * BLOCKS_PER_ALIGN
+
+    return [(start, min(start + shard_n_block, n_block)) for start in range(0, n_block, shard_n_block)]
+
+
+def encryptShard(in_name: str, out_name: str, public_key: PublicKey, block_start: int, block_stop: int,
+                 n_plain_byte: int) -> None:
+    context = KeyContext(public_key)
+    width = getBlockWidth(public_key.k)
+    n_bit = context.n_bit
+
+    # Workers share the resource tracker of the parent, which unlinks the memory at the end
+    shm_in, shm_out = shared_memory.SharedMemory(name=in_name), shared_memory.SharedMemory(name=out_name)
+    try:
+        byte_start = block_start // BLOCKS_PER_ALIGN * n_bit
+        byte_stop = min(-(-block_stop // BLOCKS_PER_ALIGN) * n_bit, n_plain_byte)
+
+        packer = BlockPacker(n_bit)
+        with shm_in.buf[byte_start:byte_stop] as data:
+            blocks = packer.feed(data) + packer.finish()
+
+        encrypted = context.encryptBlocks(blocks, start_at=block_start)
+        shm_out.buf[block_start * width:block_stop * width] = \
+            b"".join([x.to_bytes(width, "little") for x in encrypted])
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+
+def decryptShard(in_name: str, out_name: str, public_key: PublicKey, private_key: PrivateKey,
+                 block_start: int, block_stop: int) -> int:
+    """
+    Returns number of plaintext bytes written by this shard.
+    """
+    context = KeyContext(public_key, private_key)
+    width = getBlockWidth(public_key.k)
+    n = context.n
+
+    # Workers share the resource tracker of the parent, which unlinks the memory at the end
+    shm_in, shm_out = shared_memory.SharedMemory(name=in_name), shared_memory.SharedMemory(name=out_name)
+    try:
+        with shm_in.buf[block_start * width:block_stop * width] as data:
+            blocks = [int.from_bytes(data[i:i + width], "little") for i in range(0, len(data), width)]
+
+        # `block_start` is times of 8, so it is always even
+        even, odd = context.decrypt_multipliers
+        plain_blocks = [0] * len(blocks)
+        plain_blocks[0::2] = arithmetic.mulModList(blocks[0::2], even, n)
+        plain_blocks[1::2] = arithmetic.mulModList(blocks[1::2], odd, n)
+
+        plain = BlockUnpacker().feed(plain_blocks)
+        byte_start = block_start // BLOCKS_PER_ALIGN * context.n_bit
+        shm_out.buf[byte_start:byte_start + len(plain)] = plain
+        return len(plain)
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+
+def encryptGoldbachParallel(message: str, public_key: PublicKey, *,
+                            encoding: str = "utf-8",
+                            n_worker: int = None,
+                            executor: Executor = None) -> BlockArray:
+    """
+    Same result as `encryptGoldbach`, but blocks are encrypted by a process pool.
+    Plaintext and ciphertext are passed through shared memory.
+    """
+    data = str(message).encode(encoding)
+    n_bit = public_key.less_than_n_bit - 1
+    width = getBlockWidth(public_key.k)
+    n_block = BlockPacker.countBlocks(len(data), n_bit)
+    if n_block == 0:
+        return BlockArray(width)
+
+    n_worker = n_worker or cpu_count()
+    shm_in = shared_memory.SharedMemory(create=True, size=len(data))
+    shm_out = shared_memory.SharedMemory(create=True, size=n_block * width)
+    own_executor = executor is None
+    executor = ProcessPoolExecutor(n_worker) if own_executor else executor
+
+    try:
+        shm_in.buf[:len(data)] = data
+        futures = [executor.submit(encryptShard, shm_in.name, shm_out.name, public_key, start, stop, len(data))
+                   for start, stop in splitShards(n_block, n_worker)]
+        for future in futures:
+            future.result()
+
+        return BlockArray(width, bytearray(shm_out.buf[:n_block * width]))
+    finally:
+        if own_executor:
+            executor.shutdown()
+        for shm in (shm_in, shm_out):
+            shm.close()
+            shm.unlink()
+
+
+def decryptGoldbachParallel(message: Sequence[int], public_key: PublicKey, private_key: PrivateKey, *,
+                            encoding: str = "utf-8",
+                            n_worker: int = None,
+                            executor: Executor = None) -> str:
+    """
+    Same result as `decryptGoldbach`. `public_key` is needed for the block width (from `k`).
+    """
+    n_block = len(message)
+    if n_block == 0:
+        return ""
+
+    n_bit = public_key.less_than_n_bit - 1
+    width = getBlockWidth(public_key.k)
+    n_worker = n_worker or cpu_count()
+    shards = splitShards(n_block, n_worker)
+
+    shm_in = shared_memory.SharedMemory(create=True, size=n_block * width)
+    # At most `n_bit` bits a block
+    shm_out = shared_memory.SharedMemory(create=True, size=-(-n_block * n_bit // 8))
+    own_executor = executor is None
+    executor = ProcessPoolExecutor(n_worker) if own_executor else executor
+
+    try:
+        # Already in the layout of the shared memory, no need to convert
+        if not (isinstance(message, BlockArray) and message.width == width):
+            message = BlockArray.fromBlocks(message, width)
+        shm_in.buf[:n_block * width] = message.memoryview()
+        futures = [executor.submit(decryptShard, shm_in.name, shm_out.name, public_key, private_key, start, stop)
+                   for start, stop in shards]
+        n_last_byte = [future.result() for future in futures][-1]
+
+        # Every shard before the last one is full
+        n_plain_byte = shards[-1][0] // BLOCKS_PER_ALIGN * n_bit + n_last_byte
+        return bytes(shm_out.buf[:n_plain_byte]).decode(encoding)
+    finally:
+        if own_executor:
+            executor.shutdown()
+        for shm in (shm_in, shm_out):
+            shm.close()
+            shm.unlink()
+
+
+def measureParallelSpeedup(message: str, public_key: PublicKey, private_key: PrivateKey, *,
+                           worker_counts: list[int] = (1, 2, 4, 8, 16, 32)) -> list[dict[str, float]]:
+    """
+    Time the parallel mode for each number of workers, compared with `KeyContext` on one core.
+    Pool start-up is not counted.
+    """
+    context = KeyContext(public_key, private_key)
+
+    start = perf_counter()
+    encrypted = context.encrypt(message)
+    serial_encrypt_seconds = perf_counter() - start
+    start = perf_counter()
+    context.decrypt(encrypted)
+    serial_decrypt_seconds = perf_counter() - start
+
+    result = []
+    for n_worker in worker_counts:
+        with ProcessPoolExecutor(n_worker) as executor:
+            # Warm up the workers
+            list(executor.map(int, range(n_worker)))
+
+            start = perf_counter()
+            encrypted = encryptGoldbachParallel(message, public_key, n_worker=n_worker, executor=executor)
+            encrypt_seconds = perf_counter() - start
+            start = perf_counter()
+            decryptGoldbachParallel(encrypted, public_key, private_key, n_worker=n_worker, executor=executor)
+            decrypt_seconds = perf_counter() - start
+
+        result.append({
+            "n_worker": n_worker,
+            "encrypt_seconds": encrypt_seconds,
+            "decrypt_seconds": decrypt_seconds,
+            "encrypt_speedup": serial_encrypt_seconds / encrypt_seconds,
+            "decrypt_speedup": serial_decrypt_seconds / decrypt_seconds
+        })
+
+    return result
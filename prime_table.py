@@ -0,0 +1,150 @@
+from argparse import ArgumentParser
+from math import isqrt
+from time import perf_counter
+
+import mmap
+import os
+import struct
+
+
+# Layout of the prime table file (all numbers are little-endian):
+#
+# * Header: magic `GBPT`, version, `max_bit`.
+# * Bitmap: one bit for each odd number below `2 ** max_bit`, set if it is prime.
+#   Odd number `v` is bit `(v >> 1) & 7` of byte `v >> 4`.
+#
+# The file is only read through `mmap`, so every process opening it shares the same pages.
+
+HEADER = struct.Struct("<4sBB")
+FILE_MAGIC = b"GBPT"
+VERSION = 1
+
+# 2 ** 32 covers 16 to 32 bit primes, the bitmap is 256 MiB
+DEFAULT_MAX_BIT = 32
+# Odd numbers sieved at a time, times of 8 so a segment is whole bytes of the bitmap
+SEGMENT_SIZE = 1 << 22
+
+
+def packBits(flags: bytes | bytearray) -> bytes:
+    """
+    Pack `flags` (each byte 0 or 1, length times of 8) into bits, `flags[i]` is bit `i & 7` of byte `i >> 3`.
+    """
+    n_byte = len(flags) >> 3
+    # Every lane is 0 or 1 in each byte, so shifting lane `j` by `j` never carries into the next byte
+    packed = 0
+    for j in range(8):
+        packed |= int.from_bytes(flags[j::8], "little") << j
+    return packed.to_bytes(n_byte, "little")
+
+
+def sieveSegment(start: int, size: int, base_primes: list[int]) -> bytearray:
+    """
+    Flags of odd numbers `2 * i + 1` for `i` in `[start, start + size)`, 1 if prime.
+    `base_primes` should be every odd prime up to the square root of the last one.
+    """
+    flags = bytearray([1]) * size
+    low = 2 * start + 1
+    high = 2 * (start + size) - 1
+
+    for p in base_primes:
+        if p * p > high:
+            break
+
+        # First odd multiple of `p` in the segment, not less than `p * p`
+        first = max(p * p, (low + p - 1) // p * p)
+        if first % 2 == 0:
+            first += p
+        if first > high:
+            continue
+
+        # Odd multiples are `2 * p` apart, which is `p` apart in index
+        index = (first - 1) // 2 - start
+        flags[index::p] = bytes(len(range(index, size, p)))
+
+    # 1 is not prime
+    if start == 0:
+        flags[0] = 0
+
+    return flags
+
+
+def buildPrimeTable(path: str, *, max_bit: int = DEFAULT_MAX_BIT, segment_size: int = SEGMENT_SIZE) -> dict:
+    """
+    Sieve every odd number below `2 ** max_bit` segment by segment, and save the bitmap to `path`.
+    Only one segment is in memory at a time. Returns the build time and file size.
+    """
+    if not 4 <= max_bit <= 40:
+        raise ValueError(f"Prime table should cover 4 to 40 bit, but got {max_bit}.")
+
+    start_time = perf_counter()
+    n_odd = 1 << (max_bit - 1)
+    segment_size = min(segment_size, n_odd)
+
+    # Odd primes up to the square root of the limit, sieved the same way.
+    #  Crossing out by every odd number (not only primes) is still right, just a bit more work on a tiny range.
+    until = isqrt(1 << max_bit) + 1
+    small = sieveSegment(0, until // 2 + 1, list(range(3, isqrt(until) + 1, 2)))
+    base_primes = [2 * i + 1 for i, is_prime in enumerate(small) if is_prime]
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as fp:
+        fp.write(HEADER.pack(FILE_MAGIC, VERSION, max_bit))
+        for start in range(0, n_odd, segment_size):
+            fp.write(packBits(sieveSegment(start, min(segment_size, n_odd - start), base_primes)))
+    # Other processes never see a half built table
+    os.replace(temp_path, path)
+
+    return {"max_bit": max_bit, "seconds": perf_counter() - start_time, "file_byte": os.path.getsize(path)}
+
+
+class PrimeTable:
+    """
+    Read-only prime bitmap written by `buildPrimeTable`, memory-mapped.
+    Tells whether a number below `2 ** max_bit` is prime by reading one bit.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as fp:
+            self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.max_bit = HEADER.unpack_from(self.mm, 0)
+        if magic != FILE_MAGIC or version != VERSION:
+            raise ValueError(f"\"{path}\" is not a GoldbachEnc prime table (version {VERSION}).")
+
+        # Checkpoint: a truncated bitmap would say "not prime" for everything after the end
+        if len(self.mm) != HEADER.size + (1 << (self.max_bit - 4)):
+            raise ValueError(f"Prime table \"{path}\" is truncated.")
+
+    def covers(self, n_bit: int) -> bool:
+        """
+        Whether every `n_bit` bit number is in the table.
+        """
+        return n_bit <= self.max_bit
+
+    def isPrime(self, n: int) -> bool:
+        if n < 3 or n % 2 == 0:
+            return n == 2
+
+        i = n >> 1
+        return (self.mm[HEADER.size + (i >> 3)] >> (i & 7)) & 1 == 1
+
+    def close(self) -> None:
+        self.mm.close()
+
+    def __enter__(self) -> "PrimeTable":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Build the prime table used by `mathfunc.usePrimeTable`.")
+    parser.add_argument("path")
+    parser.add_argument("--max-bit", type=int, default=DEFAULT_MAX_BIT, help="Cover every prime below 2 ** this.")
+    args = parser.parse_args()
+
+    report = buildPrimeTable(args.path, max_bit=args.max_bit)
+    print(f"{args.path}: primes below 2^{report['max_bit']}, {report['file_byte'] / (1 << 20):.1f} MiB "
+          f"in {report['seconds']:.1f}s")
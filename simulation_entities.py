@@ -1,5 +1,12 @@
-from random import Random
 from cryptfunc import *
+from key_pool import KeyPool
+from key_directory import MappedPublicKeyDirectory, PublicKeyDirectory, PublicKeyView
+from keyring import Keyring
+
+from collections.abc import Iterable, MutableMapping, Sequence
+from concurrent.futures import Executor
+
+import mmap
 
 
 class User:
@@ -19,63 +26,228 @@ class User:
 
 
 class User:
-    def __init__(self, name: str) -> None:
+    def __init__(self, name: str, *, key_pool: KeyPool = None, keyring_path: str = None,
+                 key_directory: PublicKeyDirectory | MappedPublicKeyDirectory = None) -> None:
         self.name = name
-        # This map key_name to `k` value
-        self.key_name_map: dict[str, int] = dict()
-        # This is multiple instances of my key, queried by `k` value
-        self.key_holder: dict[int, GoldbachKey] = dict()
-        # This is others' key
-        self.key_of_others: dict[str, PublicKey] = dict()
+        # If given, new keys are taken from this pool instead of generated on the spot
+        self.key_pool = key_pool
+        # This is multiple instances of my key, queried by `k` value or by key name
+        #  (saved to `keyring_path` if given, and loaded from it when it already exists)
+        self.key_holder = Keyring(keyring_path)
+        # This is others' key. With a shared directory, only keys not in the directory take memory here.
+        self.key_of_others: MutableMapping[str, PublicKey] = \
+            dict() if key_directory is None else PublicKeyView(key_directory)
 
         # Set the default encode and decode method
         self.encode_method = self.decode_method = "utf-8"
 
-    def generateKey(self, *, key_name: str = None):
-        goldbach_key = generateKeyGoldbach()
-        k = goldbach_key.public_key.k
+        # Memo of block results for each key, queried by `k` value (only when enabled)
+        self.block_cache_capacity: int = None
+        self.block_caches: dict[int, BlockCipherCache] = dict()
+        # Precomputed `KeyContext` for each key that is used, queried by `k` value
+        self.key_contexts: dict[int, KeyContext] = dict()
+
+    def close(self) -> None:
+        """
+        Close the keyring (its file and mapping, if it is saved to `keyring_path`).
+        """
+        self.key_holder.close()
+
+    def __enter__(self) -> "User":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def generateKey(self, *, key_name: str = None, a_bit: int = 16, b_bit: int = 16,
+                    block_width: BlockWidth = BlockWidth.maximum):
+        """
+        Key sizes are passed to `generateKeyGoldbach`, but not used if the key is taken from `key_pool`.
+        """
+        if self.key_pool is None:
+            goldbach_key = generateKeyGoldbach(a_bit=a_bit, b_bit=b_bit, block_width=block_width)
+        else:
+            goldbach_key = self.key_pool.get()
+        self.addKey(goldbach_key, key_name=key_name)
 
-        if key_name is not None:
-            self.key_name_map[key_name] = k
+    def addKey(self, goldbach_key: GoldbachKey, *, key_name: str = None):
+        self.key_holder.add(goldbach_key, name=key_name)
 
-        self.key_holder[k] = goldbach_key
+    def dropKey(self, k: int):
+        """
+        Remove my key with value `k`, and the cache of it.
+        """
+        if k not in self.key_holder:
+            raise KeyError(f"User \"{self.name}\" does not have key with k = {k}.")
 
-    def sendPublicKeyTo(self, user: User, *, use_key_with_name: str = None):
+        self.key_holder.drop(k)
+        self.forgetKeyState(k)
+
+    def forgetKeyState(self, k: int):
+        """
+        Drop the things computed for key `k` (cache and context).
+        """
+        self.block_caches.pop(k, None)
+        self.key_contexts.pop(k, None)
+
+    def enableBlockCache(self, capacity: int = 4096):
+        self.block_cache_capacity = capacity
+
+    def disableBlockCache(self):
+        self.block_cache_capacity = None
+        self.block_caches.clear()
+
+    def getBlockCache(self, k: int) -> BlockCipherCache | None:
+        if self.block_cache_capacity is None:
+            return None
+
+        if k not in self.block_caches:
+            self.block_caches[k] = BlockCipherCache(self.block_cache_capacity)
+
+        return self.block_caches[k]
+
+    def getEncryptContext(self, public_key: PublicKey) -> KeyContext:
+        if public_key.k not in self.key_contexts:
+            self.key_contexts[public_key.k] = KeyContext(public_key)
+
+        return self.key_contexts[public_key.k]
+
+    def getDecryptContext(self, k: int) -> KeyContext:
+        context = self.key_contexts.get(k)
+        if context is None or context.private_key is None:
+            goldbach_key = self.key_holder[k]
+            context = self.key_contexts[k] = KeyContext(goldbach_key.public_key, goldbach_key.private_key)
+
+        return context
+
+    def getKeyStats(self) -> dict[int, dict[str, int | float]]:
+        """
+        Ciphertext expansion of each of my keys, queried by `k` value.
+        """
+        return {k: getKeyStats(self.key_holder[k].public_key) for k in self.key_holder}
+
+    def getBlockCacheStats(self) -> dict[int, dict[str, int | float]]:
+        return {k: cache.getStats() for k, cache in self.block_caches.items()}
+
+    def choosePublicKey(self, *, use_key_with_name: str = None) -> PublicKey:
         if len(self.key_holder) == 0:
             self.generateKey()
 
         # If specifying the key name
         if use_key_with_name is not None:
-            if use_key_with_name not in self.key_name_map:
+            if not self.key_holder.hasName(use_key_with_name):
                 raise KeyError(f"Key \"{use_key_with_name}\" not in user \"{self.name}\"'s named key.")
-            public_key = self.key_holder[self.key_name_map[use_key_with_name]]
+            public_key = self.key_holder.getByName(use_key_with_name).public_key
         # If not specifying the key name, use default
         else:
             # The key used is not named
-            unnamed_keys = [k for k in self.key_holder if k not in self.key_name_map.values()]
-            public_key = self.key_holder[unnamed_keys[Random().randint(0, len(unnamed_keys) - 1)]].public_key
+            public_key = self.key_holder.chooseUnnamed().public_key
 
-        user.savePublicKey(self.name, public_key)
+        return public_key
+
+    def sendPublicKeyTo(self, user: User, *, use_key_with_name: str = None):
+        user.savePublicKey(self.name, self.choosePublicKey(use_key_with_name=use_key_with_name))
+
+    def publishPublicKey(self, directory: PublicKeyDirectory, *, use_key_with_name: str = None):
+        """
+        Let every user sharing `directory` have my public key.
+        """
+        directory.publish(self.name, self.choosePublicKey(use_key_with_name=use_key_with_name))
 
     def savePublicKey(self, name: str, key: PublicKey):
+        # The cache and context of the replaced key will not be used anymore
+        if name in self.key_of_others and self.key_of_others[name].k != key.k:
+            self.forgetKeyState(self.key_of_others[name].k)
+
         self.key_of_others[name] = key
 
-    def sendEncMsgTo(self, name: str, message: str, mode: EncDecMode = EncDecMode.byte_wise) -> GoldbachEncMessage:
+    def sendEncMsgTo(self, name: str, message: str | bytes | bytearray | memoryview | mmap.mmap,
+                     mode: EncDecMode = EncDecMode.byte_wise, *,
+                     compression: Compression = Compression.none) -> GoldbachEncMessage:
+        """
+        `compression` is done before encrypting (not for `char_wise`), and recorded in the message.
+        """
         if name not in self.key_of_others:
             raise KeyError(f"The user \"{self.name}\" does not have user \"{name}\" public key.")
+        if mode == EncDecMode.char_wise and compression != Compression.none:
+            raise ValueError("EncDecMode.char_wise can not be compressed.")
 
         keys = self.key_of_others[name]
+        cache = self.getBlockCache(keys.k)
+        match mode:
+            case EncDecMode.byte_wise if compression == Compression.none:
+                # Binary message is encrypted as it is, like `encryptGoldbach` (not as its `str`)
+                context = self.getEncryptContext(keys)
+                if isinstance(message, BYTES_LIKE):
+                    blocks = context.encryptBytes(message, cache=cache)
+                else:
+                    blocks = context.encrypt(message, cache=cache)
+                return GoldbachEncMessage(blocks, keys.k)
+            case EncDecMode.char_wise:
+                return encryptGoldbachSimple(message, keys.a_inv, keys.b_inv, keys.k, cache=cache)
+            case EncDecMode.byte_wise | EncDecMode.binary:
+                # Same as without compression, binary message is taken as it is
+                if mode == EncDecMode.byte_wise and not isinstance(message, BYTES_LIKE):
+                    data = str(message).encode("utf-8")
+                else:
+                    data = message
+                data, compression = compressPayload(data, compression)
+                return GoldbachEncMessage(self.getEncryptContext(keys).encryptBytes(data, cache=cache), keys.k,
+                                          compression=compression)
+
+    def encryptForMany(self, names: Iterable[str], message: str | bytes | bytearray | memoryview | mmap.mmap,
+                       mode: EncDecMode = EncDecMode.byte_wise) -> dict[str, GoldbachEncMessage]:
+        """
+        Encrypt `message` for each of `names`, cut into blocks only once for all keys of the same block width.
+        Each result decrypts to the same as `sendEncMsgTo` without compression (`str` is encoded in UTF-8,
+        bytes-like are taken as they are), see `cryptfunc.encryptForMany`.
+        """
+        keys = dict()
+        for name in names:
+            if name not in self.key_of_others:
+                raise KeyError(f"The user \"{self.name}\" does not have user \"{name}\" public key.")
+            keys[name] = self.key_of_others[name]
+
         match mode:
-            case EncDecMode.byte_wise:
-                return GoldbachEncMessage(encryptGoldbach(message, keys), keys.k)
+            case EncDecMode.byte_wise | EncDecMode.binary:
+                return encryptForMany(message, keys)
             case EncDecMode.char_wise:
-                return GoldbachEncMessage(encryptGoldbachSimple(message, keys.a_inv, keys.b_inv, keys.k))
+                # Nothing to share, each character is a block already
+                return {name: self.sendEncMsgTo(name, message, mode) for name in keys}
+
+    def sendEncMsgBatch(self, name: str, messages: Sequence[str | bytes | bytearray | memoryview | mmap.mmap],
+                        mode: EncDecMode = EncDecMode.byte_wise, *,
+                        executor: Executor = None) -> GoldbachEncBatch:
+        """
+        Encrypt many messages to one user, see `encryptGoldbachBatch`. `char_wise` is not supported.
+        """
+        if name not in self.key_of_others:
+            raise KeyError(f"The user \"{self.name}\" does not have user \"{name}\" public key.")
+        if mode == EncDecMode.char_wise:
+            raise ValueError("EncDecMode.char_wise can not be used for a batch.")
+
+        return encryptGoldbachBatch(messages, self.key_of_others[name], executor=executor)
+
+    def decryptEncMsgBatch(self, enc_batch: GoldbachEncBatch, mode: EncDecMode = EncDecMode.byte_wise, *,
+                           executor: Executor = None) -> list[str | bytes]:
+        if mode == EncDecMode.char_wise:
+            raise ValueError("EncDecMode.char_wise can not be used for a batch.")
+
+        # Binary messages are given back as `bytes`
+        return decryptGoldbachBatch(enc_batch, self.key_holder[enc_batch.k].private_key,
+                                    encoding="utf-8" if mode == EncDecMode.byte_wise else None, executor=executor)
 
-    def decryptEncMsg(self, enc_message: GoldbachEncMessage, mode: EncDecMode = EncDecMode.byte_wise) -> str:
+    def decryptEncMsg(self, enc_message: GoldbachEncMessage,
+                      mode: EncDecMode = EncDecMode.byte_wise) -> str | bytes:
         message, k = enc_message.message, enc_message.k
         keys = self.key_holder[k].private_key
+        cache = self.getBlockCache(k)
+        compression = enc_message.compression
         match mode:
-            case EncDecMode.byte_wise:
-                return decryptGoldbach(message, keys)
+            case EncDecMode.byte_wise if compression == Compression.none:
+                return self.getDecryptContext(k).decrypt(message, cache=cache)
             case EncDecMode.char_wise:
-                return decryptGoldbachSimple(message, keys.a, keys.b, keys.n)
+                return decryptGoldbachSimple(message, keys.a, keys.b, keys.n, cache=cache)
+            case EncDecMode.byte_wise | EncDecMode.binary:
+                plain = decompressPayload(self.getDecryptContext(k).decryptBytes(message, cache=cache), compression)
+                return plain.decode("utf-8") if mode == EncDecMode.byte_wise else plain
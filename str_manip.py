@@ -1,9 +1,11 @@
 from functools import reduce
 from operator import add
 from collections import deque
+from collections.abc import Iterable
 from io import StringIO
 from sys import getsizeof
 
+import instrument
 import math
 import os
 
@@ -23,6 +25,12 @@ class BitExtracter:
         NOTICE: if you just exhausted the string, the result will have trailing zero.
         You should always check whether the string is exhausted.
         """
+        with instrument.stage("str_manip.getNBit") as stage:
+            result = self.__getNBit(n_bit, encoding=encoding)
+            stage.addWork(n_block=1, n_byte=len(result) // 8)
+            return result
+
+    def __getNBit(self, n_bit: int, *, encoding: str = "utf-8") -> list[int]:
         # If the string is already exhausted, should not start
         if self.__origin_str_exhausted:
             raise EOFError(f"The string you want to extract is already exhausted.")
@@ -141,6 +149,27 @@ class BitExtracter:
     def getPositionInByte(self) -> int:
         return self.getPositionInBit() / 8
 
+    def getState(self) -> dict:
+        """
+        Where the extracter is, in plain types (can be saved as JSON).
+        Give it to `setState` of a new extracter on the same string to continue from here.
+        """
+        return {"position_by_codepoint": self.__position_by_codepoint,
+                "position_in_bit": self.__position_in_bit,
+                "remain": list(self.__getNBit_buffer_of_remain),
+                "exhausted": self.__origin_str_exhausted}
+
+    def setState(self, state: dict) -> None:
+        # Checkpoint: the state should be of a string at least this long
+        if state["position_by_codepoint"] > len(self.__origin):
+            raise ValueError(f"State at codepoint {state['position_by_codepoint']} is beyond the string "
+                             f"of length {len(self.__origin)}.")
+
+        self.__position_by_codepoint = state["position_by_codepoint"]
+        self.__position_in_bit = state["position_in_bit"]
+        self.__getNBit_buffer_of_remain = deque(state["remain"])
+        self.__origin_str_exhausted = state["exhausted"]
+
     def __getNCharFromOrigin(self, n_char: int) -> str:
         possible_max_position_exclude = min(self.__position_by_codepoint + n_char, len(self.__origin))
         result = self.__origin[self.__position_by_codepoint:possible_max_position_exclude]
@@ -150,6 +179,165 @@ class BitExtracter:
         return result
 
 
+class BlockPacker:
+    """
+    Cut bytes into blocks of `n_bit` bits, and add a leading one to every block.
+
+    Bytes are treated as one big-endian bit stream, so the result is same as
+    calling `BitExtracter.getNBit` repeatedly, but works with shifts and masks
+    on a slice of bytes at a time, instead of lists of bits.
+    The last block can be shorter than `n_bit` (but still has the leading one).
+
+    Bits that can not form a whole block are kept, until more bytes are fed
+    or `finish` is called, so the packer can be fed chunk by chunk.
+    """
+
+    # How many blocks are cut from one slice of input, should be times of 8,
+    #  so the slice (`n_bit * blocks_per_slice / 8` bytes) is always whole blocks.
+    blocks_per_slice = 64
+
+    def __init__(self, n_bit: int) -> None:
+        if n_bit < 1:
+            raise ValueError(f"Block should have at least 1 bit, but got {n_bit}.")
+
+        self.n_bit = n_bit
+        self.remain = 0
+        self.remain_n_bit = 0
+
+    def countBlocks(n_byte: int, n_bit: int) -> int:
+        """
+        Exact number of blocks that `n_byte` bytes will be cut into.
+        """
+        return -(-n_byte * 8 // n_bit)
+
+    def feed(self, data: bytes | bytearray | memoryview) -> list[int]:
+        with instrument.stage("str_manip.pack") as stage:
+            result = self.__feed(data)
+            stage.addWork(n_block=len(result), n_byte=len(data))
+            return result
+
+    def feedEach(self, messages: Iterable[bytes | bytearray | memoryview]) -> tuple[list[int], list[int]]:
+        """
+        Blocks of many messages, each message is finished on its own (so starts from a new block).
+        Also gives where each message starts in the blocks, and the end of the last one.
+        """
+        with instrument.stage("str_manip.pack") as stage:
+            blocks, offsets = [], [0]
+            n_byte = 0
+            for data in messages:
+                blocks += self.__feed(data)
+                blocks += self.finish()
+                offsets.append(len(blocks))
+                n_byte += len(data)
+            stage.addWork(n_block=len(blocks), n_byte=n_byte)
+            return blocks, offsets
+
+    def __feed(self, data: bytes | bytearray | memoryview) -> list[int]:
+        n_bit = self.n_bit
+        leading_one = 1 << n_bit
+        mask = leading_one - 1
+        slice_size = n_bit * BlockPacker.blocks_per_slice // 8
+        result = []
+
+        remain, remain_n_bit = self.remain, self.remain_n_bit
+        for start in range(0, len(data), slice_size):
+            chunk = data[start:start + slice_size]
+            len_chunk_bit = len(chunk) * 8
+            acc = (remain << len_chunk_bit) | int.from_bytes(chunk, "big")
+            acc_n_bit = remain_n_bit + len_chunk_bit
+
+            # The left most block is at shift `acc_n_bit - n_bit`, then go right.
+            result += [leading_one | ((acc >> shift) & mask)
+                       for shift in range(acc_n_bit - n_bit, -1, -n_bit)]
+
+            remain_n_bit = acc_n_bit % n_bit
+            remain = acc & ((1 << remain_n_bit) - 1)
+
+        self.remain, self.remain_n_bit = remain, remain_n_bit
+        return result
+
+    def finish(self) -> list[int]:
+        """
+        Give out the last block which is shorter than `n_bit`, if there is.
+        """
+        if self.remain_n_bit == 0:
+            return []
+
+        last_block = (1 << self.remain_n_bit) | self.remain
+        self.remain, self.remain_n_bit = 0, 0
+        return [last_block]
+
+    def getState(self) -> dict[str, int]:
+        """
+        Bits kept for the next block, in plain types (can be saved as JSON).
+        """
+        return {"n_bit": self.n_bit, "remain": self.remain, "remain_n_bit": self.remain_n_bit}
+
+    def setState(self, state: dict[str, int]) -> None:
+        # Checkpoint: kept bits of another block size would shift every later block
+        if state["n_bit"] != self.n_bit:
+            raise ValueError(f"State is of {state['n_bit']} bit blocks, but the packer cuts {self.n_bit} bit.")
+
+        self.remain, self.remain_n_bit = state["remain"], state["remain_n_bit"]
+
+
+class BlockUnpacker:
+    """
+    Reverse of `BlockPacker`, remove the leading one of every block,
+    and join the remaining bits back to bytes.
+
+    Bits that can not form a whole byte are kept until more blocks are fed.
+    """
+
+    # Convert the accumulated bits to bytes once it is longer than this,
+    #  so the accumulator int never grows too big.
+    flush_n_bit = 4096
+
+    def __init__(self) -> None:
+        self.remain = 0
+        self.remain_n_bit = 0
+
+    def feed(self, blocks: Iterable[int]) -> bytearray:
+        with instrument.stage("str_manip.unpack") as stage:
+            result = self.__feed(blocks)
+            stage.addWork(n_byte=len(result))
+            return result
+
+    def __feed(self, blocks: Iterable[int]) -> bytearray:
+        flush_n_bit = BlockUnpacker.flush_n_bit
+        result = bytearray()
+
+        acc, acc_n_bit = self.remain, self.remain_n_bit
+        for block in blocks:
+            if block < 1:
+                raise ValueError(f"Block {block} does not have the leading one.")
+
+            # Like 0b1_0100, the payload is 4 bit `0100`
+            payload_n_bit = block.bit_length() - 1
+            acc = (acc << payload_n_bit) | (block ^ (1 << payload_n_bit))
+            acc_n_bit += payload_n_bit
+
+            if acc_n_bit >= flush_n_bit:
+                remain_n_bit = acc_n_bit & 0b111
+                result += (acc >> remain_n_bit).to_bytes(acc_n_bit >> 3, "big")
+                acc &= (1 << remain_n_bit) - 1
+                acc_n_bit = remain_n_bit
+
+        # Give out all whole bytes
+        remain_n_bit = acc_n_bit & 0b111
+        result += (acc >> remain_n_bit).to_bytes(acc_n_bit >> 3, "big")
+
+        self.remain = acc & ((1 << remain_n_bit) - 1)
+        self.remain_n_bit = remain_n_bit
+        return result
+
+    def getState(self) -> dict[str, int]:
+        return {"remain": self.remain, "remain_n_bit": self.remain_n_bit}
+
+    def setState(self, state: dict[str, int]) -> None:
+        self.remain, self.remain_n_bit = state["remain"], state["remain_n_bit"]
+
+
 class StringBuffer(StringIO):
     ...
 
@@ -232,9 +420,10 @@ class StringMakerFromBytes:
         """
         Try to decode possible combination.
         """
-        match self.encoding:
-            case "utf-8": return self.decodeInUTF8()
-            case _: raise TypeError(f"Got unexpected encoding here \"{self.encoding}\"")
+        with instrument.stage("str_manip.decode"):
+            match self.encoding:
+                case "utf-8": return self.decodeInUTF8()
+                case _: raise TypeError(f"Got unexpected encoding here \"{self.encoding}\"")
 
     def decodeInUTF8(self) -> StringMakerFromBytes:
         while len(self.bytes_buffer) > 0:
@@ -0,0 +1,91 @@
+from arithmetic import GMPY2_MIN_BIT, IntBackend
+
+from math import gcd as pythonGcd
+from random import Random
+
+import arithmetic
+import unittest
+
+
+# Around the size where `mulModList` switches to `mpz`, and far from it on both sides
+BIT_SIZES = [8, 64, GMPY2_MIN_BIT - 1, GMPY2_MIN_BIT, GMPY2_MIN_BIT + 1, 1024, 4096]
+N_CASE = 50
+POW_EXPONENT_BIT = 128
+
+
+class TestBackendEquivalence(unittest.TestCase):
+    """
+    Every available `IntBackend` gives the same `int` as plain Python, for every operation of `arithmetic`.
+    """
+
+    def setUp(self) -> None:
+        self.backends = [x for x in IntBackend if arithmetic.isAvailable(x)]
+        self.old_backend = arithmetic.getBackend()
+
+    def tearDown(self) -> None:
+        arithmetic.setBackend(self.old_backend)
+
+    def forEachBackend(self, name: str, run, expected) -> None:
+        for backend in self.backends:
+            arithmetic.setBackend(backend)
+            with self.subTest(name, backend=backend.name):
+                result = run()
+                self.assertEqual(result, expected)
+                # Checkpoint: callers never see `mpz`
+                for x in result if isinstance(result, list) else [result]:
+                    self.assertIs(type(x), int)
+
+    def testMulModList(self) -> None:
+        rng = Random("mulModList")
+        for n_bit in BIT_SIZES:
+            mod = rng.getrandbits(n_bit) | (1 << (n_bit - 1))
+            factor = rng.randrange(mod)
+            numbers = [rng.randrange(mod) for _ in range(N_CASE)] + [0, mod - 1]
+            self.forEachBackend(f"{n_bit} bit", lambda: arithmetic.mulModList(numbers, factor, mod),
+                                [x * factor % mod for x in numbers])
+
+    def testPowMod(self) -> None:
+        rng = Random("powMod")
+        for n_bit in BIT_SIZES:
+            for _ in range(N_CASE):
+                mod = rng.getrandbits(n_bit) | (1 << (n_bit - 1))
+                # Short exponent, a full 4096 bit one takes seconds on `int`
+                base, exponent = rng.randrange(mod), rng.getrandbits(POW_EXPONENT_BIT)
+                self.forEachBackend(f"{n_bit} bit", lambda: arithmetic.powMod(base, exponent, mod),
+                                    pow(base, exponent, mod))
+
+    def testInvert(self) -> None:
+        rng = Random("invert")
+        for n_bit in BIT_SIZES:
+            for _ in range(N_CASE):
+                mod = rng.getrandbits(n_bit) | (1 << (n_bit - 1))
+                x = rng.randrange(1, mod)
+                if pythonGcd(x, mod) == 1:
+                    self.forEachBackend(f"{n_bit} bit", lambda: arithmetic.invert(x, mod), pow(x, -1, mod))
+                    continue
+
+                # Checkpoint: Same error for every backend when there is no inverse
+                for backend in self.backends:
+                    arithmetic.setBackend(backend)
+                    with self.subTest(f"{n_bit} bit not invertible", backend=backend.name):
+                        self.assertRaises(ValueError, arithmetic.invert, x, mod)
+
+    def testInvertNotInvertible(self) -> None:
+        for backend in self.backends:
+            arithmetic.setBackend(backend)
+            with self.subTest(backend=backend.name):
+                self.assertRaises(ValueError, arithmetic.invert, 6, 9)
+                self.assertRaises(ValueError, arithmetic.invert, 1 << GMPY2_MIN_BIT, 1 << (GMPY2_MIN_BIT + 1))
+
+    def testGcd(self) -> None:
+        rng = Random("gcd")
+        for n_bit in BIT_SIZES:
+            for _ in range(N_CASE):
+                # Common factor on purpose, otherwise almost every pair is coprime
+                common = rng.getrandbits(n_bit // 2) + 1
+                a, b = rng.getrandbits(n_bit) * common, rng.getrandbits(n_bit) * common
+                self.forEachBackend(f"{n_bit} bit", lambda: arithmetic.gcd(a, b), pythonGcd(a, b))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+from math import ceil
+from random import Random
+
+
+# Inputs and statistics shared by `benchmark.py` and the load test of `messaging_service.py`
+
+# Characters of each corpus
+CORPUS_ALPHABETS = {
+    "ascii": [chr(c) for c in range(0x20, 0x7F)] + ["\n"],
+    "cjk": [chr(c) for c in range(0x4E00, 0x9FA6)] + ["，", "。", "\n"],
+    "emoji": [chr(c) for c in range(0x1F600, 0x1F650)] + [" ", "\n"],
+}
+
+
+def makeCorpus(kind: str, n_byte: int, *, seed: int = 0) -> str:
+    """
+    Text of `kind` which is about `n_byte` bytes in UTF-8 (not more), same for same `seed`.
+    """
+    rng = Random(f"{seed}-{kind}")
+    alphabet = CORPUS_ALPHABETS[kind]
+    base = "".join([rng.choice(alphabet) for _ in range(4096)])
+    len_base = len(base.encode("utf-8"))
+
+    # Repeat the base, then cut it at a character boundary
+    repeated = (base * (n_byte // len_base + 1)).encode("utf-8")[:n_byte]
+    return repeated.decode("utf-8", errors="ignore")
+
+
+def getPercentile(sorted_values: list[float], percent: float) -> float:
+    # Nearest-rank percentile
+    return sorted_values[max(0, ceil(percent / 100 * len(sorted_values)) - 1)]